@@ -1,8 +1,18 @@
 from django.contrib import admin
+from django.db.models import Prefetch
 from import_export import resources
 from import_export.admin import ImportExportModelAdmin
 
-from .models import Diet, Food, MealPlan, Nutrition, Profile, Submission, User
+from .models import (
+    Diet,
+    Food,
+    MealPlan,
+    MealPlanFood,
+    Nutrition,
+    Profile,
+    Submission,
+    User,
+)
 
 
 class UserResource(resources.ModelResource):
@@ -21,6 +31,10 @@ class FoodResource(resources.ModelResource):
     class Meta:
         model = Food
         import_id_fields = ("food_id",)
+        exclude = ("nutrients",)
+
+    def get_queryset(self):
+        return super().get_queryset().select_related("fk_nutrition")
 
 
 class ProfileResource(resources.ModelResource):
@@ -28,12 +42,31 @@ class ProfileResource(resources.ModelResource):
         model = Profile
         import_id_fields = ("profile_id",)
 
+    def get_queryset(self):
+        return (
+            super().get_queryset().select_related("fk_diet", "fk_nutrition", "fk_user")
+        )
+
 
 class MealPlanResource(resources.ModelResource):
     class Meta:
         model = MealPlan
         import_id_fields = ("meal_plan_id",)
 
+    def get_queryset(self):
+        return (
+            super()
+            .get_queryset()
+            .select_related("fk_diet")
+            .prefetch_related(
+                Prefetch("meal_plan_foods", MealPlanFood.objects.order_by("position"))
+            )
+        )
+
+    def dehydrate_foods(self, meal_plan: MealPlan):
+        # Restores number foods by their order in this column
+        return ",".join(str(i.fk_food_id) for i in meal_plan.meal_plan_foods.all())
+
 
 class NutritionResource(resources.ModelResource):
     class Meta:
@@ -46,6 +79,20 @@ class SubmissionResource(resources.ModelResource):
         model = Submission
         import_id_fields = ("submission_id",)
 
+    def get_queryset(self):
+        return super().get_queryset().select_related("fk_user")
+
+
+BACKUP_RESOURCES = {
+    "users": UserResource,
+    "profiles": ProfileResource,
+    "diets": DietResource,
+    "meal_plans": MealPlanResource,
+    "submissions": SubmissionResource,
+    "foods": FoodResource,
+    "nutritions": NutritionResource,
+}
+
 
 class Admin(ImportExportModelAdmin):
     resource_classes = [
@@ -0,0 +1,137 @@
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from server.database import apply_pragmas
+
+# sqlite3 defaults, which is what the bare sqlite3 backend ran with
+DEFAULT_CONFIG = ({"timeout": 5.0}, {"journal_mode": "DELETE", "synchronous": "FULL"})
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares concurrent IoT-style writes and dashboard-style reads on a "
+        "scratch SQLite file with sqlite3 defaults and with the tuned settings "
+        "of the default database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--writers", type=int, default=4)
+        parser.add_argument("--readers", type=int, default=4)
+        parser.add_argument("--seconds", type=float, default=5.0)
+        parser.add_argument("--users", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        database = settings.DATABASES["default"]
+        configs = {
+            "default": DEFAULT_CONFIG,
+            "tuned": (database.get("OPTIONS", {}), database.get("PRAGMAS", {})),
+        }
+        for name, (connect, pragmas) in configs.items():
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, "benchmark.sqlite3")
+                self.prepare(path, options["users"])
+                result = self.run(path, connect, pragmas, options)
+            self.stdout.write(
+                f"{name:8} "
+                + "  ".join(
+                    f"{kind} {ops / options['seconds']:8.1f}/s "
+                    f"p99 {p99:7.2f}ms errors {errors}"
+                    for kind, (ops, p99, errors) in result.items()
+                )
+            )
+
+    @staticmethod
+    def prepare(path: str, users: int):
+        connection = sqlite3.connect(path)
+        connection.executescript(
+            "CREATE TABLE user (user_id INTEGER PRIMARY KEY, blood_pressure "
+            "INTEGER, heart_rate INTEGER, oxygen_level INTEGER);"
+            "CREATE TABLE reading (reading_id INTEGER PRIMARY KEY, user_id "
+            "INTEGER, timestamp REAL, blood_pressure INTEGER);"
+            "CREATE INDEX reading_user_timestamp ON reading (user_id, timestamp);"
+        )
+        connection.executemany(
+            "INSERT INTO user VALUES (?, 0, 0, 0)", [(i,) for i in range(users)]
+        )
+        connection.commit()
+        connection.close()
+
+    @staticmethod
+    def run(path: str, connect: dict, pragmas: dict, options: dict):
+        users = options["users"]
+        deadline = time.perf_counter() + options["seconds"]
+        results = {"write": ([], []), "read": ([], [])}
+        lock = threading.Lock()
+
+        def write(connection):
+            user_id = random.randrange(users)
+            with connection:
+                connection.execute(
+                    "UPDATE user SET blood_pressure = ? WHERE user_id = ?",
+                    (random.randint(80, 120), user_id),
+                )
+                connection.execute(
+                    "INSERT INTO reading (user_id, timestamp, blood_pressure) "
+                    "VALUES (?, ?, ?)",
+                    (user_id, time.time(), 100),
+                )
+
+        def read(connection):
+            connection.execute(
+                "SELECT * FROM user ORDER BY user_id LIMIT 50 OFFSET ?",
+                (random.randrange(users),),
+            ).fetchall()
+            connection.execute(
+                "SELECT COUNT(*), AVG(blood_pressure) FROM reading WHERE user_id = ?",
+                (random.randrange(users),),
+            ).fetchall()
+
+        def worker(kind: str, fn):
+            connection = sqlite3.connect(path, **connect)
+            apply_pragmas(connection, pragmas)
+            timings, errors = [], []
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                try:
+                    fn(connection)
+                except sqlite3.OperationalError as e:
+                    errors.append(e)
+                    continue
+                timings.append(time.perf_counter() - start)
+            connection.close()
+            with lock:
+                results[kind][0].extend(timings)
+                results[kind][1].extend(errors)
+
+        threads = [
+            threading.Thread(target=worker, args=("write", write))
+            for _ in range(options["writers"])
+        ] + [
+            threading.Thread(target=worker, args=("read", read))
+            for _ in range(options["readers"])
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        return {
+            kind: (
+                len(timings),
+                (
+                    statistics.quantiles(timings, n=100)[98] * 1000
+                    if len(timings) > 1
+                    else 0.0
+                ),
+                len(errors),
+            )
+            for kind, (timings, errors) in results.items()
+        }
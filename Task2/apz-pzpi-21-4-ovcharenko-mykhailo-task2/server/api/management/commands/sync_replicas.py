@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.utils.routing import READ_REPLICAS, sync_replicas
+
+
+class Command(BaseCommand):
+    help = (
+        "Copies the default SQLite database into every read replica, once or "
+        "every --interval seconds."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--interval", type=float, default=0.0)
+
+    def handle(self, *args, **options):
+        while True:
+            start = time.perf_counter()
+            sync_replicas()
+            self.stdout.write(
+                f"Synced {len(READ_REPLICAS.get('ALIASES', []))} replicas "
+                f"in {(time.perf_counter() - start) * 1000:.1f}ms"
+            )
+            if not options["interval"]:
+                return
+            time.sleep(options["interval"])
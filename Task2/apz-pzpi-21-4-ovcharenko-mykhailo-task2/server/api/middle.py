@@ -1,9 +1,8 @@
-class DisableCSRFMiddleware(object):
+from django.utils.deprecation import MiddlewareMixin
 
-    def __init__(self, get_response):
-        self.get_response = get_response
 
-    def __call__(self, request):
+class DisableCSRFMiddleware(MiddlewareMixin):
+    # MiddlewareMixin serves sync and async requests without adapting them
+
+    def process_request(self, request):
         setattr(request, "_dont_enforce_csrf_checks", True)
-        response = self.get_response(request)
-        return response
@@ -0,0 +1,41 @@
+# Generated by Django 5.0.4 on 2026-10-16 20:25
+
+import api.models
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0006_user_blood_pressure_user_heart_rate_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DietIntake",
+            fields=[
+                (
+                    "fk_diet",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="intake",
+                        serialize=False,
+                        to="api.diet",
+                    ),
+                ),
+                ("carbs", models.FloatField(default=0.0)),
+                ("protein", models.FloatField(default=0.0)),
+                ("fat", models.FloatField(default=0.0)),
+                ("calories", models.FloatField(default=0.0)),
+                ("vitamins", models.JSONField(default=dict)),
+                ("minerals", models.JSONField(default=dict)),
+                ("amino_acids", models.JSONField(default=dict)),
+            ],
+            options={
+                "db_table": "DietIntake",
+            },
+            bases=(models.Model, api.models.Model),
+        ),
+    ]
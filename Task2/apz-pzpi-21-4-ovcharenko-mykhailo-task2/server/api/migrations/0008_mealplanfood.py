@@ -0,0 +1,100 @@
+# Generated by Django 5.0.4 on 2026-10-16 20:26
+
+import api.models
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def foods_to_rows(apps, schema_editor):
+    MealPlan = apps.get_model("api", "MealPlan")
+    MealPlanFood = apps.get_model("api", "MealPlanFood")
+    Food = apps.get_model("api", "Food")
+    db = schema_editor.connection.alias
+
+    plans = {
+        plan.meal_plan_id: [int(i) for i in str(plan.foods).split(",") if i]
+        for plan in MealPlan.objects.using(db).only("foods")
+    }
+    existing = set(
+        Food.objects.using(db)
+        .filter(food_id__in={i for ids in plans.values() for i in ids})
+        .values_list("food_id", flat=True)
+    )
+    MealPlanFood.objects.using(db).bulk_create(
+        [
+            MealPlanFood(fk_meal_plan_id=plan_id, fk_food_id=food_id, position=i)
+            for plan_id, ids in plans.items()
+            for i, food_id in enumerate([j for j in ids if j in existing])
+        ],
+        batch_size=1000,
+    )
+
+
+def rows_to_foods(apps, schema_editor):
+    MealPlan = apps.get_model("api", "MealPlan")
+    MealPlanFood = apps.get_model("api", "MealPlanFood")
+    db = schema_editor.connection.alias
+
+    foods: dict[int, list[str]] = {}
+    for row in MealPlanFood.objects.using(db).order_by("fk_meal_plan_id", "position"):
+        foods.setdefault(row.fk_meal_plan_id, []).append(str(row.fk_food_id))
+    for plan in MealPlan.objects.using(db):
+        plan.foods = ",".join(foods.get(plan.meal_plan_id, []))
+        plan.save(using=db, update_fields=["foods"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0007_dietintake"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MealPlanFood",
+            fields=[
+                (
+                    "meal_plan_food_id",
+                    models.BigAutoField(primary_key=True, serialize=False),
+                ),
+                ("position", models.PositiveSmallIntegerField(default=0)),
+                (
+                    "fk_food",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="meal_plan_foods",
+                        to="api.food",
+                    ),
+                ),
+                (
+                    "fk_meal_plan",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="meal_plan_foods",
+                        to="api.mealplan",
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "MealPlanFood",
+            },
+            bases=(models.Model, api.models.Model),
+        ),
+        migrations.RunPython(foods_to_rows, rows_to_foods),
+        migrations.AlterField(
+            model_name="mealplan",
+            name="foods",
+            field=models.TextField(default=""),
+        ),
+        migrations.RemoveField(
+            model_name="mealplan",
+            name="foods",
+        ),
+        migrations.AddField(
+            model_name="mealplan",
+            name="foods",
+            field=models.ManyToManyField(
+                related_name="meal_plans", through="api.MealPlanFood", to="api.food"
+            ),
+        ),
+    ]
@@ -0,0 +1,79 @@
+# Generated by Django 5.0.4 on 2026-10-16 20:30
+
+import api.models
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0008_mealplanfood"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="VitalsRollup",
+            fields=[
+                ("rollup_id", models.BigAutoField(primary_key=True, serialize=False)),
+                ("resolution", models.IntegerField()),
+                ("bucket", models.DateTimeField()),
+                ("count", models.IntegerField(default=0)),
+                ("blood_pressure_min", models.SmallIntegerField(default=0)),
+                ("blood_pressure_max", models.SmallIntegerField(default=0)),
+                ("blood_pressure_sum", models.BigIntegerField(default=0)),
+                ("heart_rate_min", models.SmallIntegerField(default=0)),
+                ("heart_rate_max", models.SmallIntegerField(default=0)),
+                ("heart_rate_sum", models.BigIntegerField(default=0)),
+                ("oxygen_level_min", models.SmallIntegerField(default=0)),
+                ("oxygen_level_max", models.SmallIntegerField(default=0)),
+                ("oxygen_level_sum", models.BigIntegerField(default=0)),
+                (
+                    "fk_user",
+                    models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="api.user",
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "VitalsRollup",
+            },
+            bases=(models.Model, api.models.Model),
+        ),
+        migrations.CreateModel(
+            name="VitalsReading",
+            fields=[
+                ("reading_id", models.BigAutoField(primary_key=True, serialize=False)),
+                ("timestamp", models.DateTimeField()),
+                ("blood_pressure", models.SmallIntegerField()),
+                ("heart_rate", models.SmallIntegerField()),
+                ("oxygen_level", models.SmallIntegerField()),
+                (
+                    "fk_user",
+                    models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="api.user",
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "VitalsReading",
+                "indexes": [
+                    models.Index(
+                        fields=["fk_user", "timestamp"], name="reading_user_timestamp"
+                    )
+                ],
+            },
+            bases=(models.Model, api.models.Model),
+        ),
+        migrations.AddConstraint(
+            model_name="vitalsrollup",
+            constraint=models.UniqueConstraint(
+                fields=("fk_user", "resolution", "bucket"),
+                name="rollup_user_resolution_bucket",
+            ),
+        ),
+    ]
@@ -0,0 +1,45 @@
+import json
+
+from django.db import migrations
+
+FIELDS = ["vitamins", "minerals", "amino_acids"]
+
+
+def convert(apps, schema_editor, fn):
+    Nutrition = apps.get_model("api", "Nutrition")
+    db = schema_editor.connection.alias
+
+    batch = []
+    for nutrition in Nutrition.objects.using(db).iterator(chunk_size=1000):
+        for name in FIELDS:
+            setattr(nutrition, name, fn(getattr(nutrition, name)))
+        batch.append(nutrition)
+        if len(batch) >= 1000:
+            Nutrition.objects.using(db).bulk_update(batch, FIELDS)
+            batch = []
+    Nutrition.objects.using(db).bulk_update(batch, FIELDS)
+
+
+def unwrap(value):
+    while type(value) is str:
+        value = json.loads(value)
+    return value
+
+
+def unwrap_json(apps, schema_editor):
+    convert(apps, schema_editor, unwrap)
+
+
+def wrap_json(apps, schema_editor):
+    convert(apps, schema_editor, json.dumps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0009_vitals"),
+    ]
+
+    operations = [
+        migrations.RunPython(unwrap_json, wrap_json),
+    ]
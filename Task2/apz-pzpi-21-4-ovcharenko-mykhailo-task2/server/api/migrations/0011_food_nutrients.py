@@ -0,0 +1,43 @@
+# Generated by Django 5.0.4 on 2026-10-16 20:34
+
+from django.db import migrations, models
+
+from api import nutrients
+
+
+def pack_nutrients(apps, schema_editor):
+    Food = apps.get_model("api", "Food")
+    db = schema_editor.connection.alias
+
+    batch = []
+    for food in (
+        Food.objects.using(db).select_related("fk_nutrition").iterator(chunk_size=1000)
+    ):
+        food.nutrients = nutrients.pack(
+            {name: getattr(food, name) for name in nutrients.MACROS},
+            {
+                name: getattr(food.fk_nutrition, name) if food.fk_nutrition else {}
+                for name in nutrients.GROUPS
+            },
+        )
+        batch.append(food)
+        if len(batch) >= 1000:
+            Food.objects.using(db).bulk_update(batch, ["nutrients"])
+            batch = []
+    Food.objects.using(db).bulk_update(batch, ["nutrients"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0010_unwrap_nutrition_json"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="food",
+            name="nutrients",
+            field=models.BinaryField(null=True),
+        ),
+        migrations.RunPython(pack_nutrients, migrations.RunPython.noop),
+    ]
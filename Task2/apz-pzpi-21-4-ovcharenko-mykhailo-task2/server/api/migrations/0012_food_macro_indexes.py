@@ -0,0 +1,29 @@
+# Generated by Django 5.0.4 on 2026-10-16 20:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0011_food_nutrients"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="food",
+            index=models.Index(fields=["carbs"], name="food_carbs"),
+        ),
+        migrations.AddIndex(
+            model_name="food",
+            index=models.Index(fields=["protein"], name="food_protein"),
+        ),
+        migrations.AddIndex(
+            model_name="food",
+            index=models.Index(fields=["fat"], name="food_fat"),
+        ),
+        migrations.AddIndex(
+            model_name="food",
+            index=models.Index(fields=["calories"], name="food_calories"),
+        ),
+    ]
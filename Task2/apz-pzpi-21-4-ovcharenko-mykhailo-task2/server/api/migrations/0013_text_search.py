@@ -0,0 +1,36 @@
+from django.db import migrations
+
+TABLES = {"FoodSearch": "Food", "DietSearch": "Diet"}
+
+
+def create_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for table, source in TABLES.items():
+        schema_editor.execute(
+            f'CREATE VIRTUAL TABLE "{table}" USING fts5('
+            f"name, description, tokenize='unicode61 remove_diacritics 2', "
+            f"prefix='2 3')"
+        )
+        schema_editor.execute(
+            f'INSERT INTO "{table}" (rowid, name, description) '
+            f'SELECT {source.lower()}_id, name, description FROM "{source}"'
+        )
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for table in TABLES:
+        schema_editor.execute(f'DROP TABLE IF EXISTS "{table}"')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0012_food_macro_indexes"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.0.4 on 2026-10-16 20:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0013_text_search"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="diet",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name="dietintake",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name="food",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name="mealplan",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name="nutrition",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -1,4 +1,9 @@
-from django.db import models
+import datetime
+
+from django.db import IntegrityError, models, transaction
+from django.db.models.signals import m2m_changed
+
+from . import nutrients
 
 ROLE_CHOICES = (
     (0, "user"),
@@ -13,6 +18,13 @@ TIME_CHOICES = (
     (3, "dinner"),
 )
 
+VITALS = ["blood_pressure", "heart_rate", "oxygen_level"]
+
+ROLLUP_RESOLUTIONS = {
+    "minute": 60,
+    "hour": 3600,
+}
+
 
 class Model:
     objects = models.Manager()
@@ -67,6 +79,7 @@ class Diet(models.Model, Model):
     name = models.CharField(max_length=32)
     description = models.TextField(default="", blank=True)
     photo_url = models.TextField()
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         db_table = "Diet"
@@ -76,16 +89,57 @@ class MealPlan(models.Model, Model):
     meal_plan_id = models.BigAutoField(primary_key=True)
     time = models.SmallIntegerField(default=0, choices=TIME_CHOICES)  # type: ignore
     fk_diet = models.ForeignKey("Diet", on_delete=models.CASCADE)
-    foods = models.TextField()
+    foods = models.ManyToManyField(
+        "Food", through="MealPlanFood", related_name="meal_plans"
+    )
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         db_table = "MealPlan"
 
     def get_foods(self) -> list["Food"]:
-        diets = [
-            Food.secure_get(food_id=int(i)) for i in str(self.foods).split(",") if i
-        ]
-        return [i for i in diets if i]
+        return list(
+            Food.objects.filter(meal_plan_foods__fk_meal_plan=self).order_by(
+                "meal_plan_foods__position"
+            )
+        )
+
+    def set_foods(self, food_ids: list[int]):
+        MealPlanFood.objects.filter(fk_meal_plan=self).delete()
+        MealPlanFood.objects.bulk_create(
+            [
+                MealPlanFood(fk_meal_plan=self, fk_food_id=food_id, position=i)
+                for i, food_id in enumerate(food_ids)
+            ]
+        )
+        m2m_changed.send(
+            sender=MealPlanFood,
+            instance=self,
+            action="post_add",
+            reverse=False,
+            model=Food,
+            pk_set=set(food_ids),
+        )
+
+    @classmethod
+    def get_diet_ids(cls, food_ids: set[int]) -> set[int]:
+        return set(
+            cls.objects.filter(foods__in=food_ids).values_list("fk_diet_id", flat=True)
+        )
+
+
+class MealPlanFood(models.Model, Model):
+    meal_plan_food_id = models.BigAutoField(primary_key=True)
+    fk_meal_plan = models.ForeignKey(
+        "MealPlan", on_delete=models.CASCADE, related_name="meal_plan_foods"
+    )
+    fk_food = models.ForeignKey(
+        "Food", on_delete=models.CASCADE, related_name="meal_plan_foods"
+    )
+    position = models.PositiveSmallIntegerField(default=0)  # type: ignore
+
+    class Meta:
+        db_table = "MealPlanFood"
 
 
 class Submission(models.Model, Model):
@@ -109,9 +163,34 @@ class Food(models.Model, Model):
     fat = models.FloatField()
     calories = models.FloatField()
     fk_nutrition = models.ForeignKey("Nutrition", on_delete=models.SET_NULL, null=True)
+    nutrients = models.BinaryField(null=True, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         db_table = "Food"
+        indexes = [
+            models.Index(fields=[name], name=f"food_{name}")
+            for name in nutrients.MACROS
+        ]
+
+    def pack_nutrients(self):
+        nutrition = self.fk_nutrition
+        self.nutrients = nutrients.pack(
+            {name: getattr(self, name) for name in nutrients.MACROS},
+            {
+                name: getattr(nutrition, name) if nutrition else {}
+                for name in nutrients.GROUPS
+            },
+        )
+
+    @classmethod
+    def refresh_nutrients(cls, food_ids: set[int]):
+        foods = list(
+            cls.objects.filter(food_id__in=food_ids).select_related("fk_nutrition")
+        )
+        for food in foods:
+            food.pack_nutrients()
+        cls.objects.bulk_update(foods, ["nutrients"], batch_size=500)
 
 
 class Nutrition(models.Model, Model):
@@ -119,6 +198,213 @@ class Nutrition(models.Model, Model):
     vitamins = models.JSONField(default=dict)
     minerals = models.JSONField(default=dict)
     amino_acids = models.JSONField(default=dict)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         db_table = "Nutrition"
+
+
+class DietIntake(models.Model, Model):
+    fk_diet = models.OneToOneField(
+        "Diet", on_delete=models.CASCADE, primary_key=True, related_name="intake"
+    )
+    carbs = models.FloatField(default=0.0)  # type: ignore
+    protein = models.FloatField(default=0.0)  # type: ignore
+    fat = models.FloatField(default=0.0)  # type: ignore
+    calories = models.FloatField(default=0.0)  # type: ignore
+    vitamins = models.JSONField(default=dict)
+    minerals = models.JSONField(default=dict)
+    amino_acids = models.JSONField(default=dict)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = "DietIntake"
+
+    def as_dict(self):
+        return {
+            "carbs": self.carbs,
+            "protein": self.protein,
+            "fat": self.fat,
+            "calories": self.calories,
+            "vitamins": self.vitamins,
+            "minerals": self.minerals,
+            "amino_acids": self.amino_acids,
+        }
+
+    @classmethod
+    def compute(cls, diet_id: int) -> "DietIntake":
+        plans: dict[int, list] = {
+            i: []
+            for i in MealPlan.objects.filter(fk_diet_id=diet_id).values_list(
+                "meal_plan_id", flat=True
+            )
+        }
+        for plan_id, data in MealPlanFood.objects.filter(
+            fk_meal_plan__fk_diet_id=diet_id
+        ).values_list("fk_meal_plan_id", "fk_food__nutrients"):
+            plans[plan_id].append(nutrients.unpack(data))
+
+        # Plans without foods count as zero macros
+        empty = nutrients.unpack(None)
+        for name in nutrients.MACROS:
+            empty[nutrients.INDEX[name]] = 0.0
+        macros = nutrients.mean(
+            [nutrients.mean(i) if i else empty for i in plans.values()]
+        )
+        micros = nutrients.as_dict(
+            nutrients.mean([j for i in plans.values() for j in i])
+        )
+
+        return cls(
+            fk_diet_id=diet_id,
+            **{
+                name: macros[nutrients.INDEX[name]] if plans else 0.0
+                for name in nutrients.MACROS
+            },
+            **{name: micros[name] for name in nutrients.GROUPS},
+        )
+
+    @classmethod
+    def get_or_compute(cls, diet_id: int) -> "DietIntake":
+        intake = cls.objects.filter(fk_diet_id=diet_id).first()
+        if intake is not None:
+            return intake
+        # Concurrent reads of a diet without intake may all try to create it
+        intake, _ = cls.objects.get_or_create(
+            fk_diet_id=diet_id, defaults=cls.compute(diet_id).as_dict()
+        )
+        return intake
+
+    @classmethod
+    def refresh(cls, diet_ids: set[int]):
+        for diet_id in Diet.objects.filter(diet_id__in=diet_ids).values_list(
+            "diet_id", flat=True
+        ):
+            cls.compute(diet_id).save()
+
+
+class VitalsReading(models.Model, Model):
+    reading_id = models.BigAutoField(primary_key=True)
+    fk_user = models.ForeignKey("User", on_delete=models.CASCADE, db_index=False)
+    timestamp = models.DateTimeField()
+    blood_pressure = models.SmallIntegerField()
+    heart_rate = models.SmallIntegerField()
+    oxygen_level = models.SmallIntegerField()
+
+    class Meta:
+        db_table = "VitalsReading"
+        indexes = [
+            models.Index(fields=["fk_user", "timestamp"], name="reading_user_timestamp")
+        ]
+
+    @classmethod
+    def record(cls, readings: list["VitalsReading"]):
+        with transaction.atomic():
+            cls.objects.bulk_create(readings, batch_size=500)
+            for resolution in ROLLUP_RESOLUTIONS.values():
+                VitalsRollup.merge(readings, resolution)
+
+
+class VitalsRollup(models.Model, Model):
+    rollup_id = models.BigAutoField(primary_key=True)
+    fk_user = models.ForeignKey("User", on_delete=models.CASCADE, db_index=False)
+    resolution = models.IntegerField()
+    bucket = models.DateTimeField()
+    count = models.IntegerField(default=0)  # type: ignore
+    blood_pressure_min = models.SmallIntegerField(default=0)  # type: ignore
+    blood_pressure_max = models.SmallIntegerField(default=0)  # type: ignore
+    blood_pressure_sum = models.BigIntegerField(default=0)  # type: ignore
+    heart_rate_min = models.SmallIntegerField(default=0)  # type: ignore
+    heart_rate_max = models.SmallIntegerField(default=0)  # type: ignore
+    heart_rate_sum = models.BigIntegerField(default=0)  # type: ignore
+    oxygen_level_min = models.SmallIntegerField(default=0)  # type: ignore
+    oxygen_level_max = models.SmallIntegerField(default=0)  # type: ignore
+    oxygen_level_sum = models.BigIntegerField(default=0)  # type: ignore
+
+    class Meta:
+        db_table = "VitalsRollup"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["fk_user", "resolution", "bucket"],
+                name="rollup_user_resolution_bucket",
+            )
+        ]
+
+    @staticmethod
+    def get_bucket(timestamp: datetime.datetime, resolution: int):
+        seconds = int(timestamp.timestamp()) // resolution * resolution
+        return datetime.datetime.fromtimestamp(seconds, tz=datetime.timezone.utc)
+
+    def add(self, other: "VitalsRollup | VitalsReading", count: int = 1):
+        for name in VITALS:
+            low, high, total = (
+                (getattr(other, f"{name}_{i}") for i in ["min", "max", "sum"])
+                if isinstance(other, VitalsRollup)
+                else (getattr(other, name),) * 3
+            )
+            if not self.count:
+                setattr(self, f"{name}_min", low)
+                setattr(self, f"{name}_max", high)
+                setattr(self, f"{name}_sum", total)
+                continue
+            setattr(self, f"{name}_min", min(getattr(self, f"{name}_min"), low))
+            setattr(self, f"{name}_max", max(getattr(self, f"{name}_max"), high))
+            setattr(self, f"{name}_sum", getattr(self, f"{name}_sum") + total)
+        self.count += count
+
+    @classmethod
+    def merge(cls, readings: list[VitalsReading], resolution: int, attempts: int = 3):
+        for attempt in range(attempts):
+            try:
+                with transaction.atomic():
+                    return cls._merge(readings, resolution)
+            except IntegrityError:
+                # Another writer inserted one of the new buckets after they
+                # were read, the next pass updates it instead
+                if attempt == attempts - 1:
+                    raise
+
+    @classmethod
+    def _merge(cls, readings: list[VitalsReading], resolution: int):
+        buckets: dict[tuple, VitalsRollup] = {}
+        for reading in readings:
+            bucket = cls.get_bucket(reading.timestamp, resolution)  # type: ignore
+            key = (reading.fk_user_id, bucket)  # type: ignore
+            if key not in buckets:
+                buckets[key] = cls(
+                    fk_user_id=key[0], resolution=resolution, bucket=bucket
+                )
+            buckets[key].add(reading)
+
+        existing = []
+        for rollup in cls.objects.filter(
+            resolution=resolution,
+            fk_user_id__in={i[0] for i in buckets.keys()},
+            bucket__in={i[1] for i in buckets.keys()},
+        ):
+            key = (rollup.fk_user_id, rollup.bucket)  # type: ignore
+            if key in buckets:
+                pending = buckets.pop(key)
+                rollup.add(pending, pending.count)
+                existing.append(rollup)
+
+        cls.objects.bulk_create(buckets.values(), batch_size=500)
+        cls.objects.bulk_update(
+            existing,
+            ["count", *[f"{i}_{j}" for i in VITALS for j in ["min", "max", "sum"]]],
+            batch_size=500,
+        )
+
+    def as_dict(self):
+        return {
+            "timestamp": self.bucket,
+            "count": self.count,
+            **{
+                name: {
+                    "min": getattr(self, f"{name}_min"),
+                    "max": getattr(self, f"{name}_max"),
+                    "avg": getattr(self, f"{name}_sum") / self.count,
+                }
+                for name in VITALS
+            },
+        }
@@ -0,0 +1,114 @@
+import math
+from array import array
+
+VITAMINS = [
+    "vitamin_a",
+    "vitamin_b6",
+    "vitamin_b12",
+    "vitamin_c",
+    "vitamin_d",
+    "vitamin_e",
+    "vitamin_k1",
+    "betaine",
+    "choline",
+    "folate",
+    "thiamin",
+    "riboflavin",
+    "pantothenic_acid",
+    "niacin",
+]
+
+MINERALS = [
+    "calcium",
+    "copper",
+    "fluoride",
+    "iron",
+    "magnesium",
+    "manganese",
+    "phosphorus",
+    "potassium",
+    "selenium",
+    "sodium",
+    "zinc",
+]
+
+AMINO_ACIDS = [
+    "alanine",
+    "arginine",
+    "aspartic_acid",
+    "cystine",
+    "glutamic_acid",
+    "glycine",
+    "histidine",
+    "isoleucine",
+    "leucine",
+    "lysine",
+    "methionine",
+    "phenylalanine",
+    "proline",
+    "serine",
+    "threonine",
+    "tyrosine",
+    "valine",
+]
+
+
+MACROS = ["carbs", "protein", "fat", "calories"]
+
+GROUPS = {
+    "vitamins": VITAMINS,
+    "minerals": MINERALS,
+    "amino_acids": AMINO_ACIDS,
+}
+
+# Fixed vector layout: macros first, then every micronutrient group in order
+NUTRIENTS = [*MACROS, *VITAMINS, *MINERALS, *AMINO_ACIDS]
+
+INDEX = {name: i for i, name in enumerate(NUTRIENTS)}
+
+MISSING = float("nan")
+
+
+def pack(macros: dict[str, float], groups: dict[str, dict]) -> bytes:
+    vector = array("d", [MISSING]) * len(NUTRIENTS)
+    for name in MACROS:
+        vector[INDEX[name]] = float(macros[name])
+    for values in groups.values():
+        for key, value in (values or {}).items():
+            # Blank values were stored before they were parsed, they count as missing
+            if key in INDEX and value not in [None, ""]:
+                vector[INDEX[key]] = float(value)
+    return vector.tobytes()
+
+
+def unpack(data: bytes | None) -> array:
+    vector = array("d")
+    if data:
+        vector.frombytes(data)
+    else:
+        vector.extend([MISSING] * len(NUTRIENTS))
+    return vector
+
+
+def mean(vectors: list[array]) -> array:
+    # Missing values are skipped per column, like averaging the dicts key by key
+    result = array("d", [MISSING]) * len(NUTRIENTS)
+    for i, column in enumerate(zip(*vectors)):
+        present = [j for j in column if j == j]
+        if present:
+            result[i] = math.fsum(present) / len(present)
+    return result
+
+
+def as_dict(vector: array) -> dict:
+    return {
+        **{name: vector[INDEX[name]] for name in MACROS},
+        **{
+            group: {
+                k: vector[INDEX[k]]
+                for k in keys
+                if vector[INDEX[k]] == vector[INDEX[k]]
+            }
+            for group, keys in GROUPS.items()
+        },
+    }
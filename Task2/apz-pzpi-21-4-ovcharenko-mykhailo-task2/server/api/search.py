@@ -0,0 +1,239 @@
+import heapq
+import math
+import re
+import threading
+import time
+from array import array
+
+from django.db import connection, connections
+from django.db.models import FloatField, Model, QuerySet
+from django.db.models.fields.json import KeyTextTransform
+from django.db.models.functions import Cast
+
+from . import nutrients
+from .models import Diet, Food
+
+NUTRIENT_INDEX_TTL = 300.0
+
+GROUP = {name: group for group, names in nutrients.GROUPS.items() for name in names}
+
+
+class NutrientIndex:
+    def __init__(self, ttl: float = NUTRIENT_INDEX_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._reloading = threading.Lock()
+        self._vectors: dict[int, array] = {}
+        self._changes: dict[int, array | None] | None = None
+        self._generation = 0
+        self._loaded = False
+        self._expires = 0.0
+
+    @property
+    def vectors(self) -> dict[int, array]:
+        # Only the first load is waited for, afterwards readers keep using the
+        # old vectors while one thread rebuilds them
+        if self._expires < time.monotonic() and self._reloading.acquire(
+            blocking=not self._loaded
+        ):
+            try:
+                if self._expires < time.monotonic():
+                    self._reload()
+            finally:
+                self._reloading.release()
+        return self._vectors
+
+    def _reload(self):
+        # Built without holding _lock, changes made meanwhile are replayed on
+        # top of the new vectors before they are swapped in
+        with self._lock:
+            self._changes = {}
+            generation = self._generation
+        try:
+            vectors = {
+                food_id: nutrients.unpack(data)
+                for food_id, data in Food.objects.values_list(
+                    "food_id", "nutrients"
+                ).iterator(chunk_size=2000)
+            }
+        except Exception:
+            with self._lock:
+                self._changes = None
+            raise
+        with self._lock:
+            for food_id, vector in self._changes.items():
+                if vector is None:
+                    vectors.pop(food_id, None)
+                else:
+                    vectors[food_id] = vector
+            self._changes = None
+            self._vectors = vectors
+            self._loaded = True
+            if generation == self._generation:
+                self._expires = time.monotonic() + self.ttl
+
+    def update(self, food: Food):
+        vector = nutrients.unpack(food.nutrients)  # type: ignore
+        with self._lock:
+            self._vectors[food.pk] = vector
+            if self._changes is not None:
+                self._changes[food.pk] = vector
+
+    def remove(self, food_id: int):
+        with self._lock:
+            self._vectors.pop(food_id, None)
+            if self._changes is not None:
+                self._changes[food_id] = None
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._expires = 0.0
+
+
+nutrient_index = NutrientIndex()
+
+
+def distance(vector: array, target: dict[str, float]) -> float:
+    # Relative error keeps calories from drowning out milligram nutrients
+    total = 0.0
+    for name, value in target.items():
+        actual = vector[nutrients.INDEX[name]]
+        if actual != actual:
+            actual = 0.0
+        total += ((actual - value) / max(abs(value), 1.0)) ** 2
+    return math.sqrt(total)
+
+
+def in_range(vector: array, minimum: dict[str, float], maximum: dict[str, float]):
+    for name, value in minimum.items():
+        actual = vector[nutrients.INDEX[name]]
+        if actual != actual or actual < value:
+            return False
+    for name, value in maximum.items():
+        actual = vector[nutrients.INDEX[name]]
+        if actual != actual or actual > value:
+            return False
+    return True
+
+
+def search_foods(
+    queryset: QuerySet,
+    minimum: dict[str, float],
+    maximum: dict[str, float],
+    target: dict[str, float],
+    limit: int,
+) -> list[tuple[Food, float | None]]:
+    # null marks a nutrient as not bounded
+    minimum, maximum, target = [
+        {k: float(v) for k, v in i.items() if v is not None}
+        for i in (minimum, maximum, target)
+    ]
+    # Macro bounds are indexed columns, micronutrient bounds narrow the rows
+    # in SQL too and are checked again against the packed vectors
+    queryset = queryset.filter(
+        **{f"{k}__gte": v for k, v in minimum.items() if k in nutrients.MACROS},
+        **{f"{k}__lte": v for k, v in maximum.items() if k in nutrients.MACROS},
+    )
+    minimum = {k: v for k, v in minimum.items() if k not in nutrients.MACROS}
+    maximum = {k: v for k, v in maximum.items() if k not in nutrients.MACROS}
+
+    if not target and not minimum and not maximum:
+        return [(food, None) for food in queryset.order_by("pk")[:limit]]
+
+    micros = {*minimum, *maximum}
+    if micros:
+        queryset = queryset.alias(
+            **{
+                f"micro_{k}": Cast(
+                    KeyTextTransform(k, f"fk_nutrition__{GROUP[k]}"), FloatField()
+                )
+                for k in micros
+            }
+        ).filter(
+            **{f"micro_{k}__gte": v for k, v in minimum.items()},
+            **{f"micro_{k}__lte": v for k, v in maximum.items()},
+        )
+
+    vectors = nutrient_index.vectors
+    food_ids = (
+        queryset.values_list("food_id", flat=True)
+        if queryset.query.has_filters()
+        else list(vectors)
+    )
+    candidates = [
+        food_id
+        for food_id in food_ids
+        if food_id in vectors and in_range(vectors[food_id], minimum, maximum)
+    ]
+    if target:
+        ranked = heapq.nsmallest(
+            limit, ((distance(vectors[i], target), i) for i in candidates)
+        )
+    else:
+        ranked = [(None, i) for i in candidates[:limit]]
+
+    foods = queryset.in_bulk([i for _, i in ranked])
+    return [(foods[i], score) for score, i in ranked if i in foods]
+
+
+class TextIndex:
+    def __init__(self, model: type[Model], table: str, weights: dict[str, float]):
+        self.model = model
+        self.table = table
+        self.weights = weights
+
+    @property
+    def enabled(self):
+        return connection.vendor == "sqlite"
+
+    def update(self, instances: list):
+        if not self.enabled or not instances:
+            return
+        fields = list(self.weights)
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'DELETE FROM "{self.table}" WHERE rowid = %s',
+                [(i.pk,) for i in instances],
+            )
+            cursor.executemany(
+                f'INSERT INTO "{self.table}" (rowid, {", ".join(fields)}) '
+                f"VALUES (%s{', %s' * len(fields)})",
+                [(i.pk, *[getattr(i, f) or "" for f in fields]) for i in instances],
+            )
+
+    def remove(self, pks: list):
+        if not self.enabled or not pks:
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'DELETE FROM "{self.table}" WHERE rowid = %s', [(i,) for i in pks]
+            )
+
+    def search(self, queryset: QuerySet, text: str, limit: int):
+        terms = re.findall(r"\w+", text)
+        if not terms:
+            return []
+        if not self.enabled:
+            for term in terms:
+                queryset = queryset.filter(name__icontains=term)
+            return [(i, None) for i in queryset.order_by("pk")[:limit]]
+
+        # Every term is a quoted prefix query, bm25 weights name over description.
+        # Ids and rows come from the same database the queryset is routed to.
+        weights = ", ".join(str(i) for i in self.weights.values())
+        with connections[queryset.db].cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid, bm25("{self.table}", {weights}) AS rank '
+                f'FROM "{self.table}" WHERE "{self.table}" MATCH %s '
+                f"ORDER BY rank LIMIT %s",
+                [" ".join(f'"{i}"*' for i in terms), limit],
+            )
+            ranked = cursor.fetchall()
+
+        rows = queryset.in_bulk([pk for pk, _ in ranked])
+        return [(rows[pk], -rank) for pk, rank in ranked if pk in rows]
+
+
+food_text_index = TextIndex(Food, "FoodSearch", {"name": 10.0, "description": 1.0})
+diet_text_index = TextIndex(Diet, "DietSearch", {"name": 10.0, "description": 1.0})
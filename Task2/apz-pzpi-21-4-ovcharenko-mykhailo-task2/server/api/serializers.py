@@ -1,18 +1,99 @@
-import statistics
-
-from django.http.response import json
-from rest_framework.serializers import ModelSerializer, SerializerMethodField
-
-from .models import Diet, Food, MealPlan, Nutrition, Profile, Submission, User
+from asgiref.sync import sync_to_async
+from django.db.models import QuerySet
+from rest_framework.serializers import (
+    ModelSerializer,
+    ReadOnlyField,
+    SerializerMethodField,
+)
+
+from .models import (
+    Diet,
+    DietIntake,
+    Food,
+    MealPlan,
+    Nutrition,
+    Profile,
+    Submission,
+    User,
+)
 from .utils.lang import Lang
+from .utils.routing import read_from_replicas
+
+
+class PlannedSerializer(ModelSerializer):
+    select_related: list[str] = []
+    prefetch_related: list[str] = []
+    # Nested or aggregate fields, collapsed to this attribute (or dropped when
+    # None) unless named in expand
+    expandable: dict[str, str | None] = {}
+
+    def __init__(
+        self,
+        lang: Lang,
+        data,
+        fields: dict | None = None,
+        expand: dict | None = None,
+    ):
+        self._lang = lang
+        self._only = fields
+        self._expand = expand
+        super().__init__(data)
 
+        # Removed fields are never evaluated, so their method fields don't run
+        if fields is not None:
+            for name in [i for i in self.fields if i not in fields]:
+                self.fields.pop(name)
+        if expand is not None:
+            for name, source in self.expandable.items():
+                if name not in self.fields or name in expand:
+                    continue
+                if source is None:
+                    self.fields.pop(name)
+                else:
+                    self.fields[name] = ReadOnlyField(
+                        **({"source": source} if source != name else {})
+                    )
+
+    def nested(self, name: str) -> dict:
+        return self.subset(name, self._only, self._expand)
 
-class UserSerializer(ModelSerializer):
-    role = SerializerMethodField()
+    @staticmethod
+    def subset(name: str, fields: dict | None, expand: dict | None) -> dict:
+        return {
+            "fields": (fields or {}).get(name) or None,
+            "expand": None if expand is None else expand.get(name, {}),
+        }
 
-    def __init__(self, lang: Lang, data):
-        self._lang = lang
-        super().__init__(data)
+    @classmethod
+    def renders(cls, name: str, fields: dict | None, expand: dict | None) -> bool:
+        # False when name is left out or collapsed, so it needs no prefetch
+        if fields is not None and name not in fields:
+            return False
+        return expand is None or name not in cls.expandable or name in expand
+
+    @classmethod
+    def plan(cls, queryset: QuerySet) -> QuerySet:
+        if cls.select_related:
+            queryset = queryset.select_related(*cls.select_related)
+        if cls.prefetch_related:
+            queryset = queryset.prefetch_related(*cls.prefetch_related)
+        return queryset
+
+    @classmethod
+    def prefetch(cls, rows: list) -> list:
+        return rows
+
+    # Async views render on the event loop, so everything the method fields
+    # read has to be loaded here first
+    @classmethod
+    async def aprefetch(
+        cls, rows: list, fields: dict | None = None, expand: dict | None = None
+    ) -> list:
+        return rows
+
+
+class UserSerializer(PlannedSerializer):
+    role = SerializerMethodField()
 
     class Meta:
         model = User
@@ -37,15 +118,7 @@ class UserSerializer(ModelSerializer):
         return {"id": obj.role, "name": self._lang.translate(f"role.{obj.role}")}
 
 
-class NutritionSerializer(ModelSerializer):
-    vitamins = SerializerMethodField()
-    minerals = SerializerMethodField()
-    amino_acids = SerializerMethodField()
-
-    def __init__(self, lang: Lang, data):
-        self._lang = lang
-        super().__init__(data)
-
+class NutritionSerializer(PlannedSerializer):
     class Meta:
         model = Nutrition
         fields = [
@@ -55,28 +128,14 @@ class NutritionSerializer(ModelSerializer):
             "amino_acids",
         ]
 
-    @staticmethod
-    def get_vitamins(obj: Nutrition):
-        return json.loads(obj.vitamins)  # type: ignore
-
-    @staticmethod
-    def get_minerals(obj: Nutrition):
-        return json.loads(obj.minerals)  # type: ignore
 
-    @staticmethod
-    def get_amino_acids(obj: Nutrition):
-        return json.loads(obj.amino_acids)  # type: ignore
-
-
-class ProfileSerializer(ModelSerializer):
+class ProfileSerializer(PlannedSerializer):
+    select_related = ["fk_nutrition", "fk_user"]
+    expandable = {"diet": None, "nutrition": "fk_nutrition_id", "user": "fk_user_id"}
     diet = SerializerMethodField()
     nutrition = SerializerMethodField()
     user = SerializerMethodField()
 
-    def __init__(self, lang: Lang, data):
-        self._lang = lang
-        super().__init__(data)
-
     class Meta:
         model = Profile
         fields = [
@@ -92,19 +151,19 @@ class ProfileSerializer(ModelSerializer):
         return None
 
     def get_nutrition(self, obj: Profile):
-        return NutritionSerializer(self._lang, obj.fk_nutrition).data
+        return NutritionSerializer(
+            self._lang, obj.fk_nutrition, **self.nested("nutrition")
+        ).data
 
     def get_user(self, obj: Profile):
-        return UserSerializer(self._lang, obj.fk_user).data
+        return UserSerializer(self._lang, obj.fk_user, **self.nested("user")).data
 
 
-class FoodSerializer(ModelSerializer):
+class FoodSerializer(PlannedSerializer):
+    select_related = ["fk_nutrition"]
+    expandable = {"nutrition": "fk_nutrition_id"}
     nutrition = SerializerMethodField()
 
-    def __init__(self, lang: Lang, data):
-        self._lang = lang
-        super().__init__(data)
-
     class Meta:
         model = Food
         fields = [
@@ -120,17 +179,17 @@ class FoodSerializer(ModelSerializer):
         ]
 
     def get_nutrition(self, obj: Profile):
-        return NutritionSerializer(self._lang, obj.fk_nutrition).data
+        return NutritionSerializer(
+            self._lang, obj.fk_nutrition, **self.nested("nutrition")
+        ).data
 
 
-class SubmissionSerializer(ModelSerializer):
+class SubmissionSerializer(PlannedSerializer):
+    select_related = ["fk_user"]
+    expandable = {"reviewer": "reviewer", "user": "fk_user_id"}
     reviewer = SerializerMethodField()
     user = SerializerMethodField()
 
-    def __init__(self, lang: Lang, data):
-        self._lang = lang
-        super().__init__(data)
-
     class Meta:
         model = Submission
         fields = [
@@ -141,24 +200,54 @@ class SubmissionSerializer(ModelSerializer):
             "is_accepted",
         ]
 
+    @classmethod
+    def prefetch(cls, rows: list[Submission]) -> list[Submission]:
+        reviewers = User.objects.in_bulk({i.reviewer for i in rows if i.reviewer})
+        for row in rows:
+            row._reviewer = reviewers.get(row.reviewer)  # type: ignore
+        return rows
+
+    @classmethod
+    async def aprefetch(
+        cls,
+        rows: list[Submission],
+        fields: dict | None = None,
+        expand: dict | None = None,
+    ) -> list[Submission]:
+        if not cls.renders("reviewer", fields, expand):
+            return rows
+        reviewers = await User.objects.ain_bulk(
+            {i.reviewer for i in rows if i.reviewer}
+        )
+        for row in rows:
+            row._reviewer = reviewers.get(row.reviewer)  # type: ignore
+        return rows
+
     def get_reviewer(self, obj: Submission):
         if obj.reviewer is None:
             return None
-        user = User.secure_get(user_id=obj.reviewer)
+        if not hasattr(obj, "_reviewer"):
+            self.prefetch([obj])
+        user = obj._reviewer  # type: ignore
         if user is None:
             return None
-        return UserSerializer(self._lang, user).data
+        return UserSerializer(self._lang, user, **self.nested("reviewer")).data
 
     def get_user(self, obj: Submission):
-        return UserSerializer(self._lang, obj.fk_user).data
+        return UserSerializer(self._lang, obj.fk_user, **self.nested("user")).data
 
 
-class DietSerializer(ModelSerializer):
-    average_intake = SerializerMethodField()
+def get_intake(diet_id: int) -> DietIntake:
+    # Diets only miss their intake on the replica that served the GET, the
+    # stored aggregate is read and computed on default
+    with read_from_replicas(False):
+        return DietIntake.get_or_compute(diet_id)
 
-    def __init__(self, lang: Lang, data):
-        self._lang = lang
-        super().__init__(data)
+
+class DietSerializer(PlannedSerializer):
+    select_related = ["intake"]
+    expandable = {"average_intake": None}
+    average_intake = SerializerMethodField()
 
     class Meta:
         model = Diet
@@ -170,48 +259,33 @@ class DietSerializer(ModelSerializer):
             "average_intake",
         ]
 
-    def get_average_intake(self, obj: Diet):
-        def get(property: str):
-            return statistics.mean(
-                [
-                    statistics.mean([getattr(food, property) for food in plan.get_foods()] or [0.0])  # type: ignore
-                    for plan in meal_plans
-                ]
-                or [0.0]
-            )
+    @classmethod
+    async def aprefetch(
+        cls,
+        rows: list[Diet],
+        fields: dict | None = None,
+        expand: dict | None = None,
+    ) -> list[Diet]:
+        if not cls.renders("average_intake", fields, expand):
+            return rows
+        for row in rows:
+            if not hasattr(row, "intake"):
+                row.intake = await sync_to_async(get_intake)(row.diet_id)  # type: ignore
+        return rows
 
-        def get_nutrition(property: str):
-            data: dict[str, tuple[float, int]] = {}
-            for plan in meal_plans:
-                for food in plan.get_foods():
-                    for key, value in json.loads(
-                        getattr(food.fk_nutrition, property)
-                    ).items():
-                        if data.get(key) is None:
-                            data[key] = (value, 1)
-                        else:
-                            data[key] = (data[key][0] + value, data[key][1] + 1)
-            return {k: v[0] / v[1] for k, v in data.items()}
-
-        meal_plans: list[MealPlan] = MealPlan.objects.filter(fk_diet_id=obj).all()
-        return {
-            "carbs": get("carbs"),
-            "protein": get("protein"),
-            "fat": get("fat"),
-            "calories": get("calories"),
-            "vitamins": get_nutrition("vitamins"),
-            "minerals": get_nutrition("minerals"),
-            "amino_acids": get_nutrition("amino_acids"),
-        }
+    def get_average_intake(self, obj: Diet):
+        try:
+            intake = obj.intake  # type: ignore
+        except DietIntake.DoesNotExist:
+            intake = get_intake(obj.diet_id)  # type: ignore
+        return intake.as_dict()
 
 
-class MealPlanSerializer(ModelSerializer):
+class MealPlanSerializer(PlannedSerializer):
+    select_related = ["fk_diet__intake"]
+    expandable = {"diet": "fk_diet_id"}
     diet = SerializerMethodField()
 
-    def __init__(self, lang: Lang, data):
-        self._lang = lang
-        super().__init__(data)
-
     class Meta:
         model = MealPlan
         fields = [
@@ -220,5 +294,18 @@ class MealPlanSerializer(ModelSerializer):
             "diet",
         ]
 
+    @classmethod
+    async def aprefetch(
+        cls,
+        rows: list[MealPlan],
+        fields: dict | None = None,
+        expand: dict | None = None,
+    ) -> list[MealPlan]:
+        if cls.renders("diet", fields, expand):
+            await DietSerializer.aprefetch(
+                [i.fk_diet for i in rows], **cls.subset("diet", fields, expand)
+            )
+        return rows
+
     def get_diet(self, obj: MealPlan):
-        return DietSerializer(self._lang, obj.fk_diet).data
+        return DietSerializer(self._lang, obj.fk_diet, **self.nested("diet")).data
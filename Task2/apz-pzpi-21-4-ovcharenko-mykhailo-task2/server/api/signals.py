@@ -0,0 +1,198 @@
+import threading
+
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+from django.dispatch import receiver
+
+from server.database import apply_pragmas
+
+from .models import Diet, DietIntake, Food, MealPlan, MealPlanFood, Nutrition, User
+from .search import diet_text_index, food_text_index, nutrient_index
+from .utils.cache import user_cache
+from .utils.restore import rows_restored
+
+TEXT_INDEXES = {Food: food_text_index, Diet: diet_text_index}
+
+
+@receiver(connection_created)
+def connection_tuned(sender, connection, **kwargs):
+    pragmas = connection.settings_dict.get("PRAGMAS")
+    if connection.vendor == "sqlite" and pragmas:
+        apply_pragmas(connection.connection, pragmas)
+
+
+class IntakeRefresh:
+    # Diets changed within one transaction, refreshed once when it commits
+    def __init__(self, connection):
+        self.connection = connection
+        self.diet_ids: set[int] = set()
+
+    def __call__(self):
+        self.connection.intake_refresh = None
+        DietIntake.refresh(self.diet_ids)
+
+
+def refresh_intake(diet_ids: set[int]):
+    diet_ids = {i for i in diet_ids if i is not None}
+    if not diet_ids:
+        return
+    connection = transaction.get_connection()
+    pending = getattr(connection, "intake_refresh", None)
+    # A rolled back transaction drops the callback along with its diets
+    if pending is None or pending not in [i[1] for i in connection.run_on_commit]:
+        pending = connection.intake_refresh = IntakeRefresh(connection)
+        pending.diet_ids.update(diet_ids)
+        transaction.on_commit(pending)
+    else:
+        pending.diet_ids.update(diet_ids)
+
+
+# MealPlans and Foods being deleted refresh their diets themselves, the
+# MealPlanFood rows cascading with them are skipped
+deleting = threading.local()
+
+
+def get_deleting() -> set[tuple[type, int]]:
+    if not hasattr(deleting, "rows"):
+        deleting.rows = set()
+    return deleting.rows
+
+
+@receiver(pre_delete, sender=MealPlan)
+@receiver(pre_delete, sender=Food)
+def parent_deleting(sender, instance, **kwargs):
+    get_deleting().add((sender, instance.pk))
+
+
+@receiver(post_delete, sender=MealPlan)
+@receiver(post_delete, sender=Food)
+def parent_deleted(sender, instance, **kwargs):
+    get_deleting().discard((sender, instance.pk))
+
+
+@receiver(pre_save, sender=MealPlan)
+def meal_plan_moved(sender, instance: MealPlan, **kwargs):
+    if instance.pk is None:
+        return
+    old = MealPlan.objects.filter(pk=instance.pk).values_list("fk_diet_id", flat=True)
+    refresh_intake({i for i in old if i != instance.fk_diet_id})  # type: ignore
+
+
+@receiver(post_save, sender=MealPlan)
+@receiver(post_delete, sender=MealPlan)
+def meal_plan_changed(sender, instance: MealPlan, **kwargs):
+    refresh_intake({instance.fk_diet_id})  # type: ignore
+
+
+@receiver(post_save, sender=MealPlanFood)
+@receiver(post_delete, sender=MealPlanFood)
+def meal_plan_food_changed(sender, instance: MealPlanFood, **kwargs):
+    parents = [
+        (MealPlan, instance.fk_meal_plan_id),  # type: ignore
+        (Food, instance.fk_food_id),  # type: ignore
+    ]
+    if any(i in get_deleting() for i in parents):
+        return
+    plans = MealPlan.objects.filter(pk=instance.fk_meal_plan_id)  # type: ignore
+    refresh_intake(set(plans.values_list("fk_diet_id", flat=True)))
+
+
+@receiver(m2m_changed, sender=MealPlan.foods.through)
+def meal_plan_foods_changed(sender, instance, action: str, reverse: bool, **kwargs):
+    if not action.startswith("post_"):
+        return
+    if not reverse:
+        refresh_intake({instance.fk_diet_id})
+    elif kwargs.get("pk_set"):
+        plans = MealPlan.objects.filter(pk__in=kwargs["pk_set"])
+        refresh_intake(set(plans.values_list("fk_diet_id", flat=True)))
+
+
+@receiver(pre_save, sender=Food)
+def food_saving(sender, instance: Food, **kwargs):
+    instance.pack_nutrients()
+
+
+@receiver(post_save, sender=Food)
+@receiver(pre_delete, sender=Food)
+def food_changed(sender, instance: Food, **kwargs):
+    refresh_intake(MealPlan.get_diet_ids({instance.pk}))
+
+
+@receiver(post_save, sender=Food)
+def food_indexed(sender, instance: Food, **kwargs):
+    nutrient_index.update(instance)
+
+
+@receiver(post_delete, sender=Food)
+def food_unindexed(sender, instance: Food, **kwargs):
+    nutrient_index.remove(instance.pk)  # type: ignore
+
+
+@receiver(post_save, sender=Food)
+@receiver(post_save, sender=Diet)
+def text_indexed(sender, instance, **kwargs):
+    TEXT_INDEXES[sender].update([instance])
+
+
+@receiver(post_delete, sender=Food)
+@receiver(post_delete, sender=Diet)
+def text_unindexed(sender, instance, **kwargs):
+    TEXT_INDEXES[sender].remove([instance.pk])
+
+
+@receiver(post_save, sender=Nutrition)
+@receiver(pre_delete, sender=Nutrition)
+def nutrition_changed(sender, instance: Nutrition, **kwargs):
+    food_ids = set(
+        Food.objects.filter(fk_nutrition=instance).values_list("food_id", flat=True)
+    )
+    if food_ids:
+        transaction.on_commit(lambda: Food.refresh_nutrients(food_ids))
+        transaction.on_commit(nutrient_index.invalidate)
+        refresh_intake(MealPlan.get_diet_ids(food_ids))
+
+
+@receiver(post_save, sender=User)
+def user_changed(sender, instance: User, **kwargs):
+    cached = user_cache.backend.get(instance.user_id)
+    if cached and (
+        cached.password != instance.password or cached.role != instance.role
+    ):
+        user_cache.invalidate(instance.user_id)  # type: ignore
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance: User, **kwargs):
+    user_cache.invalidate(instance.user_id)  # type: ignore
+
+
+@receiver(rows_restored)
+def rows_restored_changed(sender, instances: list, **kwargs):
+    pks = {i.pk for i in instances}
+    if sender is User:
+        for user_id in pks:
+            user_cache.invalidate(user_id)
+    elif sender is Diet:
+        diet_text_index.update(instances)
+        refresh_intake(pks)
+    elif sender is MealPlan:
+        refresh_intake({i.fk_diet_id for i in instances})
+    elif sender is Food:
+        Food.refresh_nutrients(pks)
+        nutrient_index.invalidate()
+        food_text_index.update(instances)
+        refresh_intake(MealPlan.get_diet_ids(pks))
+    elif sender is Nutrition:
+        foods = Food.objects.filter(fk_nutrition__in=pks)
+        food_ids = set(foods.values_list("pk", flat=True))
+        Food.refresh_nutrients(food_ids)
+        nutrient_index.invalidate()
+        refresh_intake(MealPlan.get_diet_ids(food_ids))
@@ -0,0 +1,146 @@
+import asyncio
+import json
+import logging
+import re
+
+from django.conf import settings
+from django.http import QueryDict
+
+from .models import VITALS, User
+from .utils.lang import Lang
+from .views import IotView, record_readings
+from .vitals import vitals_buffer
+
+STREAM_PATH = re.compile(r"/api/(?P<lang>[^/]+)/iot/stream/?")
+STREAM_CONFIG = {
+    "ACK_SIZE": 32,
+    "ACK_INTERVAL": 1.0,
+    **getattr(settings, "IOT_STREAM", {}),
+}
+
+logger = logging.getLogger(__name__)
+
+
+class TelemetryStream:
+    # One per device connection. Frames are a reading or a list of readings,
+    # user_id defaults to the one given in the connection query string
+    def __init__(self, send, lang: str, user_id: str | None):
+        self.send = send
+        self.lang = Lang(lang)
+        self.user_id = user_id
+        self.pending: list[dict] = []
+        self.seq = None
+        self.vitals: dict[str, dict] = {}
+        self.is_closed = False
+
+    async def reply(self, message: dict):
+        if self.is_closed:
+            return
+        await self.send({"type": "websocket.send", "text": json.dumps(message)})
+
+    async def receive(self, text: str):
+        try:
+            frame = json.loads(text)
+        except ValueError:
+            return await self.reply(
+                {
+                    "type": "error",
+                    "error": "Invalid format, must be: `{reading}` or `[{reading}]`",
+                }
+            )
+        readings = frame if type(frame) is list else [frame]
+        seq = None
+        for reading in [i for i in readings if type(i) is dict]:
+            if self.user_id:
+                reading.setdefault("user_id", self.user_id)
+            seq = reading.get("seq", seq)
+
+        args = IotView.Batch(self.lang).validate_all({"readings": readings})
+        if args.is_cancelled:
+            return await self.reply({"type": "error", "seq": seq, "error": args.error})
+        self.pending.extend(args.readings)  # type: ignore
+        self.seq = seq if seq is not None else self.seq
+
+    async def flush(self):
+        if not self.pending:
+            return
+        try:
+            await self._flush()
+        except Exception:
+            # Readings after the last ack may not be stored, the device resends
+            # from seq after reconnecting
+            logger.exception("Telemetry stream flush failed")
+            await self.reply(
+                {
+                    "type": "error",
+                    "seq": self.seq,
+                    "error": self.lang.translate("generic.server_error"),
+                }
+            )
+            await self.close(1011)
+
+    async def close(self, code: int):
+        if self.is_closed:
+            return
+        self.is_closed = True
+        await self.send({"type": "websocket.close", "code": code})
+
+    async def _flush(self):
+        readings, self.pending = self.pending, []
+        await self.reply(
+            {"type": "ack", "seq": self.seq, **await record_readings(readings)}
+        )
+
+        if self.is_closed:
+            return
+
+        # Vitals are only pushed back when they differ from the last push
+        users = User.objects.filter(user_id__in={i["user_id"] for i in readings})
+        async for vitals in users.values("user_id", *VITALS):
+            vitals.update(vitals_buffer.get(vitals["user_id"]) or {})
+            if self.vitals.get(vitals["user_id"]) != vitals:
+                self.vitals[vitals["user_id"]] = vitals
+                await self.reply({"type": "vitals", **vitals})
+
+    async def run(self, receive):
+        loop = asyncio.get_running_loop()
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(deadline - loop.time(), 0)
+            try:
+                message = await asyncio.wait_for(receive(), timeout)
+            except asyncio.TimeoutError:
+                await self.flush()
+                if self.is_closed:
+                    return
+                deadline = None
+                continue
+
+            if message["type"] == "websocket.disconnect":
+                self.is_closed = True
+                await self.flush()
+                return
+            if message["type"] != "websocket.receive":
+                continue
+
+            await self.receive(message.get("text") or message.get("bytes") or "")
+            if len(self.pending) >= STREAM_CONFIG["ACK_SIZE"]:
+                await self.flush()
+                if self.is_closed:
+                    return
+                deadline = None
+            elif self.pending and deadline is None:
+                deadline = loop.time() + STREAM_CONFIG["ACK_INTERVAL"]
+
+
+async def telemetry_stream(scope, receive, send):
+    message = await receive()
+    if message["type"] != "websocket.connect":
+        return
+    match = STREAM_PATH.fullmatch(scope["path"])
+    if match is None:
+        return await send({"type": "websocket.close", "code": 4404})
+
+    query = QueryDict(scope.get("query_string", b""))
+    await send({"type": "websocket.accept"})
+    await TelemetryStream(send, match["lang"], query.get("user_id")).run(receive)
@@ -1,3 +1,1106 @@
-from django.test import TestCase
+import datetime
+import gzip
+import json
+import math
+import os
+import statistics
+import tempfile
+import threading
+from unittest import mock, skipIf
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.handlers.asgi import ASGIHandler
+from django.db import OperationalError, connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+
+from server.database import check_pragmas, sqlite_database
+
+from . import nutrients, stream, vitals
+from .models import (
+    Diet,
+    DietIntake,
+    Food,
+    MealPlan,
+    MealPlanFood,
+    Nutrition,
+    Submission,
+    User,
+    VitalsReading,
+    VitalsRollup,
+)
+from .search import diet_text_index, food_text_index, nutrient_index, search_foods
+from .utils.cache import UserCache, response_cache, user_cache
+from .utils.fieldset import parse_fieldset
+from .utils.pagination import paginate
+from .utils.password import HashPool
+from .utils.routing import (
+    READ_REPLICAS,
+    ReplicaRouter,
+    read_from_replicas,
+    sticky_users,
+    sync_replicas,
+)
+from .utils.validators import (
+    INVALID,
+    ValidFloat,
+    ValidId,
+    ValidJson,
+    ValidRecords,
+    ValidString,
+)
+from .vitals import VitalsBuffer, fcntl
+
+# Declared in settings, the test runner creates and migrates it like default
+REPLICA = "test_replica"
+
+
+def create_user(user_id: str, role: int = 0, password: str = "password"):
+    return User.objects.create(
+        user_id=user_id,
+        email=f"{user_id}@example.com",
+        first_name="First",
+        last_name="Last",
+        role=role,
+        password=password,
+        date_of_birth=datetime.date(2000, 1, 1),
+    )
+
+
+def create_food(name: str, vitamins: dict | None = None):
+    nutrition = Nutrition.objects.create(
+        vitamins=vitamins or {}, minerals={}, amino_acids={}
+    )
+    return Food.objects.create(
+        name=name,
+        description="",
+        photo_url="https://example.com",
+        carbs=1,
+        protein=1,
+        fat=1,
+        calories=1,
+        fk_nutrition=nutrition,
+    )
+
+
+def reading(user_id: str, timestamp: float, blood_pressure: int = 100):
+    return {
+        "user_id": user_id,
+        "blood_pressure": blood_pressure,
+        "heart_rate": 60,
+        "oxygen_level": 98,
+        "timestamp": timestamp,
+    }
+
+
+class VitalsBufferTest(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.journal = os.path.join(directory.name, "vitals.journal")
+        create_user("device")
+
+    def create_buffer(self):
+        # The flusher thread never wakes up, tests flush by hand
+        buffer = VitalsBuffer(enabled=True, interval=3600, journal=self.journal)
+        self.addCleanup(self.crash, buffer)
+        return buffer
+
+    @staticmethod
+    def crash(buffer: VitalsBuffer):
+        for file in [buffer._file, buffer._slot]:
+            if file is not None:
+                file.close()
+        buffer.pending = []
+
+    def stored(self):
+        return list(
+            VitalsReading.objects.order_by("timestamp").values_list(
+                "blood_pressure", flat=True
+            )
+        )
+
+    def test_flush_coalesces_user_row(self):
+        buffer = self.create_buffer()
+        buffer.submit([reading("device", 10, 1), reading("device", 20, 2)])
+        self.assertEqual(buffer.get("device")["blood_pressure"], 2)  # type: ignore
+        self.assertEqual(self.stored(), [])
+
+        buffer.flush()
+        self.assertEqual(self.stored(), [1, 2])
+        self.assertEqual(User.objects.get(user_id="device").blood_pressure, 2)
+        self.assertIsNone(buffer.get("device"))
+        self.assertEqual(buffer.stats["backlog"], 0)
+
+    def test_replay_skips_committed_readings(self):
+        buffer = self.create_buffer()
+        buffer.submit([reading("device", 10, 1)])
+        buffer.flush()
+        journal = buffer.journal
+
+        # Crashed after committing 10 but before removing .flushing, with 30
+        # journaled afterwards and a torn last line
+        with open(f"{journal}.flushing", "w") as file:
+            file.write(json.dumps([reading("device", 10, 1), reading("device", 20, 2)]))
+            file.write("\n")
+        with open(journal, "w") as file:  # type: ignore
+            file.write(json.dumps([reading("device", 30, 3)]) + "\n")
+            file.write('[{"user_id": "dev')
+        self.crash(buffer)
+
+        restarted = self.create_buffer()
+        restarted.start()
+        self.assertEqual(restarted.journal, journal)
+        self.assertEqual([i["blood_pressure"] for i in restarted.pending], [2, 3])
+
+        restarted.flush()
+        self.assertEqual(self.stored(), [1, 2, 3])
+        self.assertFalse(os.path.exists(f"{journal}.flushing"))
+
+    def test_invalid_timestamps_are_rejected(self):
+        buffer = self.create_buffer()
+        with self.assertLogs("api.vitals", "ERROR"):
+            buffer.submit([reading("device", 1e20), reading("device", 10, 1)])
+        self.assertEqual([i["blood_pressure"] for i in buffer.pending], [1])
+        self.assertEqual(buffer.stats["rejected"], 1)
+        self.assertTrue(os.path.exists(f"{self.journal}.rejected"))
+
+    def test_failing_reading_is_quarantined(self):
+        buffer = self.create_buffer()
+        buffer.submit([reading("device", 10, 1), reading("device", 20, 2)])
+        store_readings = vitals.store_readings
+
+        def store(readings):
+            if any(i["blood_pressure"] == 2 for i in readings):
+                raise ValueError
+            store_readings(readings)
+
+        with mock.patch.object(vitals, "store_readings", store):
+            with self.assertLogs("api.vitals", "ERROR"):
+                buffer.flush()
+        self.assertEqual(self.stored(), [1])
+        self.assertEqual(buffer.stats["backlog"], 0)
+        self.assertEqual(buffer.stats["rejected"], 1)
+
+    @skipIf(fcntl is None, "journal slots need flock")
+    def test_crashed_slots_are_adopted(self):
+        first, second = self.create_buffer(), self.create_buffer()
+        first.submit([reading("device", 10, 1)])
+        second.submit([reading("device", 20, 2)])
+        self.assertNotEqual(first.journal, second.journal)
+        self.crash(first)
+        self.crash(second)
+
+        restarted = self.create_buffer()
+        restarted.start()
+        self.assertEqual([i["blood_pressure"] for i in restarted.pending], [1, 2])
+        self.assertFalse(os.path.exists(second.journal))  # type: ignore
+
+        restarted.flush()
+        self.assertEqual(self.stored(), [1, 2])
+
+
+class VitalsRollupTest(TestCase):
+    headers = {"AUTHORIZATION": "@device:password"}
+
+    def setUp(self):
+        create_user("device")
+        # Two flushes land in the minute starting at 120
+        vitals.store_readings(
+            [reading("device", 120, 100), reading("device", 130, 120)]
+        )
+        vitals.store_readings([reading("device", 150, 80)])
+
+    def get(self, resolution: str):
+        response = self.client.get(
+            f"/api/us/iot/vitals/@device?from=0&to=200&resolution={resolution}",
+            headers=self.headers,
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.json()["results"]
+
+    def test_flushes_merge_into_one_bucket(self):
+        for resolution in [60, 3600]:
+            rollup = VitalsRollup.objects.get(resolution=resolution)
+            self.assertEqual(rollup.count, 3)
+            self.assertEqual(
+                (
+                    rollup.blood_pressure_min,
+                    rollup.blood_pressure_max,
+                    rollup.blood_pressure_sum,
+                ),
+                (80, 120, 300),
+            )
+            self.assertEqual(rollup.heart_rate_sum, 180)
+
+    def test_vitals_resolutions(self):
+        raw = self.get("raw")
+        self.assertEqual([i["blood_pressure"] for i in raw], [100, 120, 80])
+
+        minute = self.get("minute")
+        self.assertEqual(len(minute), 1)
+        self.assertEqual(minute[0]["count"], 3)
+        self.assertEqual(
+            minute[0]["blood_pressure"], {"min": 80, "max": 120, "avg": 100.0}
+        )
+        self.assertEqual(minute[0]["heart_rate"], {"min": 60, "max": 60, "avg": 60.0})
+
+        response = self.client.get(
+            "/api/us/iot/vitals/@device?resolution=day", headers=self.headers
+        )
+        self.assertEqual(response.status_code, 409)
+
+
+class ReplicaRoutingTest(TransactionTestCase):
+    databases = {"default", REPLICA}
+
+    def setUp(self):
+        patcher = mock.patch.dict(READ_REPLICAS, ALIASES=[REPLICA])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        cache.clear()
+        response_cache.backend.clear()
+        user_cache.backend.clear()
+        # Flushing between tests leaves the full-text tables alone
+        with connection.cursor() as cursor:
+            for index in [food_text_index, diet_text_index]:
+                cursor.execute(f'DELETE FROM "{index.table}"')
+
+    def test_gets_read_from_replica(self):
+        author = create_user("author")
+        synced = Submission.objects.create(note="synced", fk_user=author)
+        sync_replicas()
+        written = Submission.objects.create(note="written", fk_user=author)
+
+        path = "/api/us/submission/query/@{}"
+        self.assertEqual(self.client.get(path.format(synced.pk)).status_code, 200)
+        self.assertEqual(self.client.get(path.format(written.pk)).status_code, 404)
+        # Code outside View GET handlers keeps reading default
+        self.assertTrue(Submission.objects.filter(pk=written.pk).exists())
+
+        sync_replicas()
+        self.assertEqual(self.client.get(path.format(written.pk)).status_code, 200)
+
+    def test_cached_handlers_read_default(self):
+        sync_replicas()
+        food = create_food("apple")
+        path = f"/api/us/food/query/@{food.pk}"
+
+        self.assertEqual(self.client.get(path).json()["name"], "apple")
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(path).json()["name"], "apple")
+
+    def test_sticky_user_reads_default(self):
+        submission = Submission.objects.create(note="old", fk_user=create_user("a"))
+        sync_replicas()
+        create_user("writer")
+        path = f"/api/us/submission/query/@{submission.pk}"
+
+        submission.note = "new"
+        submission.save()
+        sticky_users.add("writer")
+        # Someone else reads the lagging replica right after the write
+        self.assertEqual(self.client.get(path).json()["note"], "old")
+        response = self.client.get(path, headers={"AUTHORIZATION": "@writer:password"})
+        self.assertEqual(response.json()["note"], "new")
+
+    def test_missing_intake_is_computed_on_default(self):
+        diet = Diet.objects.create(name="diet", photo_url="https://example.com")
+        sync_replicas()
+        plan = MealPlan.objects.create(fk_diet=diet)
+        plan.set_foods([create_food("apple").pk])
+        DietIntake.objects.all().delete()
+
+        # Text search is not cached, so it reads the replica
+        response = self.client.get("/api/us/diet/search/@diet")
+        intake = response.json()["results"][0]["average_intake"]
+        self.assertEqual(intake["calories"], 1)
+        self.assertEqual(DietIntake.objects.get(fk_diet=diet).calories, 1)
+
+    def test_one_replica_per_request(self):
+        with mock.patch.dict(READ_REPLICAS, ALIASES=["a", "b", "c", "d"]):
+            router = ReplicaRouter()
+            for _ in range(10):
+                with read_from_replicas(True):
+                    aliases = {router.db_for_read(Food) for _ in range(10)}
+                self.assertEqual(len(aliases), 1)
+            self.assertEqual(router.db_for_read(Food), "default")
+
+    def test_text_search_reads_from_replica(self):
+        create_food("apple pie crumble")
+        sync_replicas()
+        # Ranks first on default, but the replica doesn't have it yet
+        create_food("apple")
+
+        response = self.client.get("/api/us/food/search/@apple?limit=1")
+        names = [i["name"] for i in response.json()["results"]]
+        self.assertEqual(names, ["apple pie crumble"])
+
+    def test_backup_reads_from_replica(self):
+        create_user("admin", role=2)
+        create_food("synced")
+        sync_replicas()
+        create_food("written")
+
+        response = self.client.get(
+            "/api/us/system/backup/@foods",
+            headers={"AUTHORIZATION": "@admin:password"},
+        )
+        body = b"".join(response.streaming_content).decode()
+        self.assertIn("synced", body)
+        self.assertNotIn("written", body)
+
+    def test_new_user_reads_own_writes(self):
+        sync_replicas()
+        response = self.client.post(
+            "/api/us/account/register",
+            {
+                "user_id": "newuser",
+                "password": "Str0ngPassw0rd!x",
+                "email": "newuser@example.com",
+                "first_name": "New",
+                "last_name": "User",
+                "date_of_birth": "2000-01-01",
+            },
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        headers = {"AUTHORIZATION": response.json()["token"]}
+
+        # Authentication always checks default, reads stick to it for a while
+        vitals = self.client.get("/api/us/iot/vitals/@newuser", headers=headers)
+        self.assertEqual(vitals.status_code, 200)
+        query = self.client.get("/api/us/account/query/@newuser", headers=headers)
+        self.assertEqual(query.status_code, 200)
+
+        cache.clear()
+        user_cache.backend.clear()
+        query = self.client.get("/api/us/account/query/@newuser", headers=headers)
+        self.assertEqual(query.status_code, 404)
+        vitals = self.client.get("/api/us/iot/vitals/@newuser", headers=headers)
+        self.assertEqual(vitals.status_code, 200)
+
+
+class FieldsetTest(TestCase):
+    def setUp(self):
+        response_cache.backend.clear()
+        self.food = create_food("apple", vitamins={"vitamin_c": 4.6})
+        self.reviewer = create_user("reviewer", role=1)
+        self.submission = Submission.objects.create(
+            note="note", reviewer="reviewer", fk_user=create_user("author")
+        )
+
+    def get(self, path: str):
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_parse_fieldset(self):
+        self.assertIsNone(parse_fieldset(None))
+        self.assertEqual(parse_fieldset(""), {})
+        self.assertEqual(
+            parse_fieldset("a, b.c,b.d"), {"a": {}, "b": {"c": {}, "d": {}}}
+        )
+
+    def test_fields_limit_output(self):
+        food = self.get(f"/api/us/food/query/@{self.food.pk}?fields=food_id,name")
+        self.assertEqual(food, {"food_id": self.food.pk, "name": "apple"})
+
+        page = self.get("/api/us/food/all/@0:10?fields=name")
+        self.assertEqual(page["results"], [{"name": "apple"}])
+
+    def test_expand_collapses_relations(self):
+        food = self.get(f"/api/us/food/query/@{self.food.pk}?fields=nutrition&expand=")
+        self.assertEqual(food, {"nutrition": self.food.fk_nutrition_id})  # type: ignore
+
+        food = self.get(
+            f"/api/us/food/query/@{self.food.pk}"
+            "?fields=nutrition.vitamins&expand=nutrition"
+        )
+        self.assertEqual(food, {"nutrition": {"vitamins": {"vitamin_c": 4.6}}})
+
+    def test_many_applies_fieldset(self):
+        path = f"/api/us/submission/many/@{self.submission.pk}"
+        results = self.get(f"{path}?fields=note,reviewer&expand=")["results"]
+        self.assertEqual(results, [{"note": "note", "reviewer": "reviewer"}])
+
+        results = self.get(f"{path}?fields=reviewer.email&expand=reviewer")["results"]
+        self.assertEqual(results, [{"reviewer": {"email": "reviewer@example.com"}}])
+
+    def test_collapsed_intake_is_not_computed(self):
+        diet = Diet.objects.create(name="diet", photo_url="https://example.com")
+        path = f"/api/us/diet/query/@{diet.pk}"
+
+        self.assertNotIn("average_intake", self.get(f"{path}?expand="))
+        self.assertFalse(DietIntake.objects.filter(fk_diet=diet).exists())
+
+        self.assertIn("average_intake", self.get(path))
+        # A request racing the one that created the intake reuses its row
+        self.assertEqual(DietIntake.get_or_compute(diet.pk).pk, diet.pk)
+        self.assertEqual(DietIntake.objects.filter(fk_diet=diet).count(), 1)
+
+
+class ListQueriesTest(TestCase):
+    def setUp(self):
+        response_cache.backend.clear()
+        reviewer = create_user("reviewer", role=1)
+        for i in range(20):
+            create_food(f"food{i}")
+            Submission.objects.create(
+                note="note", reviewer=reviewer.user_id, fk_user=create_user(f"u{i}")
+            )
+
+    def get(self, path: str):
+        response_cache.backend.clear()
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return response.json()["results"]
+
+    def test_pages_take_constant_queries(self):
+        # Both pages overflow, so both count the rows after them
+        for resource in ["food", "submission"]:
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(len(self.get(f"/api/us/{resource}/all/@0:1")), 1)
+            with self.assertNumQueries(len(queries)):
+                self.assertEqual(len(self.get(f"/api/us/{resource}/all/@0:19")), 19)
+
+
+class UserCacheTest(TestCase):
+    def test_get_returns_copies(self):
+        cache = UserCache({"BACKEND": "local"})
+        user = create_user("cached")
+        cache.set(user)
+        user.first_name = "Changed"
+
+        first = cache.get("cached", "password")
+        first.first_name = "Other"  # type: ignore
+        second = cache.get("cached", "password")
+        self.assertIsNot(first, second)
+        self.assertEqual(second.first_name, "First")  # type: ignore
+
+        self.assertIsNone(cache.get("cached", "wrong"))
+        self.assertEqual(cache.stats["hits"], 2)
+        self.assertEqual(cache.stats["misses"], 1)
+
+    def test_database_cache_is_refused(self):
+        backend = "django.core.cache.backends.db.DatabaseCache"
+        with self.settings(CACHES={"db": {"BACKEND": backend, "LOCATION": "cache"}}):
+            with self.assertRaises(ImproperlyConfigured):
+                UserCache({"BACKEND": "db"})
+
+
+class HashPoolTest(TestCase):
+    def test_saturated_pool_answers_busy(self):
+        pool = HashPool(workers=1, max_queue=0)
+        started, release = threading.Event(), threading.Event()
+
+        def slow_hash():
+            started.set()
+            release.wait(5)
+
+        # One request holds the only slot while the next one logs in
+        holder = threading.Thread(target=pool.run, args=(slow_hash,))
+        holder.start()
+        self.addCleanup(holder.join)
+        self.addCleanup(release.set)
+        self.assertTrue(started.wait(5))
+
+        create_user("busy")
+        with mock.patch("api.views.password_pool", pool):
+            response = self.client.post(
+                "/api/us/account/login",
+                {"user_id": "busy", "password": "Str0ngPassw0rd!x"},
+                content_type="application/json",
+            )
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(pool.stats["rejected"], 1)
+
+        release.set()
+        holder.join()
+        self.assertEqual(pool.stats["count"], 1)
+        self.assertTrue(pool.run(lambda: True))
+
+
+class BackupTest(TestCase):
+    headers = {"AUTHORIZATION": "@admin:password"}
+
+    def setUp(self):
+        create_user("admin", role=2)
+        create_food("apple")
+
+    def test_streams_csv(self):
+        response = self.client.get("/api/us/system/backup/@foods", headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.is_async)
+        rows = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(rows), 2)
+        self.assertIn("apple", rows[1])
+
+    async def test_streams_csv_under_asgi(self):
+        response = await self.async_client.get(
+            "/api/us/system/backup/@foods",
+            headers={**self.headers, "Accept-Encoding": "gzip"},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_async)
+        body = b"".join([i async for i in response.streaming_content])
+        rows = gzip.decompress(body).decode().splitlines()
+        self.assertEqual(len(rows), 2)
+        self.assertIn("apple", rows[1])
+
+
+class SearchTest(TestCase):
+    def setUp(self):
+        nutrient_index.invalidate()
+        self.foods = [
+            create_food("low", vitamins={"vitamin_c": 1.0}),
+            create_food("high", vitamins={"vitamin_c": "8.5"}),
+            create_food("none"),
+        ]
+        Food.refresh_nutrients({i.pk for i in self.foods})
+
+    def search(self, minimum={}, maximum={}, target={}):
+        results = search_foods(Food.objects.all(), minimum, maximum, target, 10)
+        return [food.name for food, _ in results]
+
+    def test_micronutrient_bounds(self):
+        self.assertEqual(self.search(minimum={"vitamin_c": 2}), ["high"])
+        self.assertEqual(self.search(maximum={"vitamin_c": 8.5}), ["low", "high"])
+        self.assertEqual(
+            self.search(minimum={"vitamin_c": 0}, target={"vitamin_c": 9}),
+            ["high", "low"],
+        )
+        self.assertEqual(len(self.search(target={"calories": 1})), 3)
+
+    def test_blank_bounds(self):
+        for body in [
+            {"minimum": {"protein": ""}},
+            {"minimum": {"vitamin_c": None}, "target": {"vitamin_c": None}},
+        ]:
+            response = self.client.post(
+                "/api/us/food/search", body, content_type="application/json"
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.json()["results"]), 3)
+
+    def test_changes_during_reload_are_kept(self):
+        removed = self.foods[0].pk
+        values_list = Food.objects.values_list
+
+        def query(*args):
+            # A food is deleted while the vectors are being rebuilt
+            nutrient_index.remove(removed)
+            return values_list(*args)
+
+        with mock.patch.object(Food.objects, "values_list", query):
+            vectors = nutrient_index.vectors
+        self.assertNotIn(removed, vectors)
+        self.assertIn(self.foods[1].pk, vectors)
+
+
+class DatabaseSettingsTest(SimpleTestCase):
+    def test_pragmas_are_whitelisted(self):
+        check_pragmas(sqlite_database("db.sqlite3")["PRAGMAS"])
+        check_pragmas({"journal_mode": "wal", "synchronous": "full"})
+        for pragmas in [
+            {"journal_mode": "WAL; DROP TABLE User"},
+            {"synchronous": "sometimes"},
+            {"cache_size": "-1024"},
+            {"foreign_keys": "OFF"},
+        ]:
+            with self.assertRaises(ImproperlyConfigured):
+                check_pragmas(pragmas)
+
+
+class AsgiMiddlewareTest(SimpleTestCase):
+    def test_middleware_is_not_adapted(self):
+        # An adapted middleware would hold a thread for every async request,
+        # Django only reports adapting with DEBUG on
+        with self.settings(DEBUG=True), self.assertNoLogs("django.request", "DEBUG"):
+            ASGIHandler().load_middleware(is_async=True)
+
+
+class TelemetryStreamTest(SimpleTestCase):
+    async def test_failed_flush_closes_with_error(self):
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        messages = [
+            {
+                "type": "websocket.receive",
+                "text": json.dumps(reading("d", 10) | {"seq": 7}),
+            },
+            {"type": "websocket.receive", "text": "{}"},
+        ]
+
+        async def receive():
+            return messages.pop(0)
+
+        with (
+            mock.patch.object(stream, "record_readings", side_effect=OperationalError),
+            mock.patch.dict(stream.STREAM_CONFIG, ACK_SIZE=1),
+            self.assertLogs("api.stream", "ERROR"),
+        ):
+            await stream.TelemetryStream(send, "us", None).run(receive)
+
+        error, close = sent
+        self.assertEqual(error["type"], "websocket.send")
+        self.assertEqual(json.loads(error["text"])["seq"], 7)
+        self.assertEqual(close, {"type": "websocket.close", "code": 1011})
+        self.assertEqual(len(messages), 1)
+
+
+class RestoreTest(TestCase):
+    headers = {"AUTHORIZATION": "@admin:password"}
+
+    def setUp(self):
+        create_user("admin", role=2)
+        self.food = create_food("apple")
+
+    def post(self, path: str, data: dict):
+        return self.client.post(
+            path, data, content_type="application/json", headers=self.headers
+        )
+
+    def rollback(self, **data):
+        return self.post("/api/us/system/rollback", {"resource": "foods", **data})
+
+    def test_dry_run_leaves_rows_alone(self):
+        backup = self.client.get("/api/us/system/backup/@foods", headers=self.headers)
+        data = b"".join(backup.streaming_content).decode().replace("apple", "pear")
+
+        response = self.rollback(data=data, dry_run=True)
+        self.assertEqual(response.status_code, 200)
+        report = response.json()
+        self.assertEqual((report["dry_run"], report["updated"]), (True, 1))
+        self.assertFalse(report["has_errors"])
+        self.assertEqual(Food.objects.get(pk=self.food.pk).name, "apple")
+
+        response = self.rollback(data=data, batch_size=1)
+        self.assertEqual(response.json()["updated"], 1)
+        self.assertEqual(Food.objects.get(pk=self.food.pk).name, "pear")
+
+    def test_partial_columns_update_only_those(self):
+        photo_url = self.food.photo_url
+        response = self.rollback(data=f"food_id,name\r\n{self.food.pk},pear\r\n")
+        self.assertFalse(response.json()["has_errors"])
+        food = Food.objects.get(pk=self.food.pk)
+        self.assertEqual((food.name, food.photo_url), ("pear", photo_url))
+
+        response = self.rollback(
+            resource="users", data="user_id,first_name\r\nadmin,Changed\r\n"
+        )
+        self.assertEqual(response.json()["updated"], 1)
+        user = User.objects.get(user_id="admin")
+        self.assertEqual(
+            (user.first_name, user.email), ("Changed", "admin@example.com")
+        )
+
+    def test_meal_plan_foods_keep_their_order(self):
+        foods = [create_food(i) for i in ["pear", "bread"]] + [self.food]
+        diet = Diet.objects.create(name="diet", photo_url="https://example.com")
+        plan = MealPlan.objects.create(fk_diet=diet)
+        # Rows are inserted out of position order
+        for position, food in [(1, foods[0]), (2, foods[1]), (0, foods[2])]:
+            MealPlanFood.objects.create(
+                fk_meal_plan=plan, fk_food=food, position=position
+            )
+        order = [foods[2].pk, foods[0].pk, foods[1].pk]
+        self.assertEqual([i.pk for i in plan.get_foods()], order)
+
+        backup = self.client.get(
+            "/api/us/system/backup/@meal_plans", headers=self.headers
+        )
+        data = b"".join(backup.streaming_content).decode()
+        self.assertIn(",".join(str(i) for i in order), data)
+
+        plan.set_foods(sorted(order))
+        response = self.rollback(resource="meal_plans", data=data)
+        self.assertFalse(response.json()["has_errors"])
+        self.assertEqual([i.pk for i in plan.get_foods()], order)
+
+    def test_non_string_values_are_rejected(self):
+        self.assertEqual(self.rollback(data=0).status_code, 400)
+        self.assertEqual(self.rollback(data="", dry_run=1).status_code, 400)
+        response = self.post(
+            "/api/us/account/register",
+            {
+                "user_id": "newuser",
+                "password": "Str0ngPassw0rd!x",
+                "email": "newuser@example.com",
+                "first_name": 0,
+                "last_name": "User",
+                "date_of_birth": "2000-01-01",
+            },
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("first_name", response.json()["error"])
+
+
+class ValidatorsTest(SimpleTestCase):
+    def test_nested_references_are_refused(self):
+        for validator in [ValidJson, ValidRecords]:
+            with self.assertRaises(TypeError):
+                validator({"diet_id": ValidId(Diet, "diet_id", int)})
+
+    def test_json_returns_parsed_values(self):
+        json_ = ValidJson({"a": ValidFloat(), "b": ValidFloat()})
+        self.assertEqual(json_.parse('{"a": "3.5", "b": null}'), {"a": 3.5, "b": None})
+        for value in ['{"c": 1}', '{"a": "x"}', "[1]", "{", 1]:
+            self.assertIs(json_.parse(value), INVALID)  # type: ignore
+
+    def test_records(self):
+        records = ValidRecords({"name": ValidString(4)}, max_length=2)
+        self.assertEqual(records.parse('[{"name": "a"}]'), [{"name": "a"}])
+        for value in ['[{"name": "a"}', "[1]", '[{"name": 1}]', [{}], [{}] * 3, {}]:
+            self.assertIs(records.parse(value), INVALID)  # type: ignore
+
+
+class ConditionalTest(TestCase):
+    def setUp(self):
+        response_cache.backend.clear()
+        self.food = create_food("apple")
+        self.path = f"/api/us/food/query/@{self.food.pk}"
+
+    def test_etag_answers_not_modified(self):
+        response = self.client.get(self.path)
+        etag, last_modified = response["ETag"], response["Last-Modified"]
+
+        response = self.client.get(self.path, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+
+        # A write within the same second keeps Last-Modified but not the ETag
+        with self.captureOnCommitCallbacks(execute=True):
+            self.food.name = "pear"
+            self.food.save()
+        response = self.client.get(self.path, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(
+            self.path, headers={"If-Modified-Since": last_modified}
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_page_validated_by_its_body(self):
+        create_food("pear")
+        path = "/api/us/food/all/@0:1"
+        # The probe and the bounded COUNT, nothing runs twice
+        with self.assertNumQueries(2):
+            etag = self.client.get(path)["ETag"]
+
+        response_cache.backend.clear()
+        response = self.client.get(path, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+
+    def test_write_invalidates_cached_get(self):
+        create_user("manager", role=1)
+        self.assertEqual(self.client.get(self.path).json()["name"], "apple")
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            response = self.client.post(
+                "/api/us/food/edit",
+                {"food_id": self.food.pk, "name": "pear"},
+                content_type="application/json",
+                headers={"AUTHORIZATION": "@manager:password"},
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(callbacks)
+        self.assertEqual(self.client.get(self.path).json()["name"], "pear")
+
+    def test_search_keeps_cached_get(self):
+        self.client.get(self.path)
+        response = self.client.post(
+            "/api/us/food/search", {}, content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 200)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(self.path).status_code, 200)
+
+    def test_response_built_before_a_write_is_not_kept(self):
+        generation, _ = response_cache.get("food", "key")
+        response_cache.invalidate("food")
+        response_cache.set("food", "key", generation, {"name": "apple"})
+        self.assertIsNone(response_cache.get("food", "key")[1])
+
+        # Uncommitted writes leave the generation alone
+        generation, _ = response_cache.get("food", "key")
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.food.save()
+            self.assertEqual(response_cache.get("food", "key")[0], generation)
+        self.assertTrue(callbacks)
+
+
+class TextSearchTest(TestCase):
+    def setUp(self):
+        response_cache.backend.clear()
+
+    def search(self, text: str):
+        response = self.client.get(f"/api/us/food/search/@{text}")
+        self.assertEqual(response.status_code, 200)
+        return [i["name"] for i in response.json()["results"]]
+
+    def test_ranked_search(self):
+        pie = create_food("pie")
+        pie.description = "apple pie"
+        pie.save()
+        create_food("green apple")
+        create_food("pear")
+
+        # Name matches outrank description matches, terms match prefixes
+        self.assertEqual(self.search("apple"), ["green apple", "pie"])
+        self.assertEqual(self.search("app gre"), ["green apple"])
+        self.assertEqual(self.search("..."), [])
+
+    def test_index_follows_saves_and_deletes(self):
+        food = create_food("apple")
+        self.assertEqual(self.search("apple"), ["apple"])
+
+        food.name = "pear"
+        food.save()
+        self.assertEqual(self.search("apple"), [])
+        self.assertEqual(self.search("pear"), ["pear"])
+
+        food.delete()
+        self.assertEqual(self.search("pear"), [])
+
+
+def average_intake(diet: Diet) -> dict:
+    # How DietSerializer computed it on every request before it was stored
+    plans = [i.get_foods() for i in MealPlan.objects.filter(fk_diet=diet)]
+
+    def macro(name: str):
+        return statistics.mean(
+            [
+                statistics.mean([getattr(i, name) for i in foods] or [0.0])
+                for foods in plans
+            ]
+            or [0.0]
+        )
+
+    def group(name: str):
+        values: dict[str, list[float]] = {}
+        for food in [j for i in plans for j in i]:
+            nutrition = getattr(food.fk_nutrition, name) if food.fk_nutrition else {}
+            for key, value in nutrition.items():
+                values.setdefault(key, []).append(value)
+        return {k: statistics.mean(v) for k, v in values.items()}
+
+    return {
+        **{i: macro(i) for i in nutrients.MACROS},
+        **{i: group(i) for i in nutrients.GROUPS},
+    }
+
+
+class DietIntakeTest(TestCase):
+    def setUp(self):
+        self.apple = create_food(
+            "apple", vitamins={"vitamin_c": 10.0, "vitamin_a": 2.0}
+        )
+        self.pear = create_food("pear", vitamins={"vitamin_c": 20.0})
+        self.bread = create_food("bread")
+        self.bread.carbs = 50
+        self.bread.fk_nutrition = None
+        self.bread.save()
+        self.diet = Diet.objects.create(name="diet", photo_url="https://example.com")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.plans = [
+                self.create_plan(i)
+                for i in [[self.apple, self.pear], [], [self.bread, self.apple]]
+            ]
+
+    def create_plan(self, foods: list, diet: Diet | None = None):
+        plan = MealPlan.objects.create(fk_diet=diet or self.diet)
+        plan.set_foods([i.pk for i in foods])
+        return plan
+
+    def assertIntake(self, diet: Diet | None = None):
+        diet = diet or self.diet
+        stored = DietIntake.objects.get(fk_diet=diet).as_dict()
+        expected = average_intake(diet)
+        self.assertEqual(stored.keys(), expected.keys())
+        for name in nutrients.MACROS:
+            self.assertAlmostEqual(stored[name], expected[name], msg=name)
+        for name in nutrients.GROUPS:
+            self.assertEqual(stored[name].keys(), expected[name].keys(), msg=name)
+            for key, value in expected[name].items():
+                self.assertAlmostEqual(stored[name][key], value, msg=key)
+
+    def test_matches_per_plan_mean(self):
+        self.assertIntake()
+        # (1 + 0 + 25.5) / 3, the plan without foods counts as zero
+        self.assertAlmostEqual(
+            DietIntake.objects.get(fk_diet=self.diet).carbs, 26.5 / 3
+        )
+
+        empty = Diet.objects.create(name="empty", photo_url="https://example.com")
+        DietIntake.get_or_compute(empty.pk)
+        self.assertIntake(empty)
+
+    def test_food_changes_refresh(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.apple.carbs = 30
+            self.apple.save()
+        self.assertIntake()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.pear.fk_nutrition.vitamins = {"vitamin_c": 5.0, "vitamin_k1": 1.0}  # type: ignore
+            self.pear.fk_nutrition.save()  # type: ignore
+        self.assertIntake()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.pear.delete()
+        self.assertIntake()
+
+    def test_meal_plan_changes_refresh(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.plans[1].set_foods([self.pear.pk])
+        self.assertIntake()
+
+        other = Diet.objects.create(name="other", photo_url="https://example.com")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.plans[0].fk_diet = other
+            self.plans[0].save()
+        self.assertIntake()
+        self.assertIntake(other)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.plans[2].delete()
+        self.assertIntake()
+
+
+    def test_cascades_refresh_once(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            plan = self.create_plan([self.apple, self.pear, self.bread] * 4)
+        compute = DietIntake.compute
+        for delete in [plan.delete, self.apple.delete]:
+            with mock.patch.object(DietIntake, "compute", side_effect=compute) as spy:
+                with self.captureOnCommitCallbacks(execute=True):
+                    delete()
+            self.assertEqual(spy.call_count, 1)
+            self.assertIntake()
+
+        with mock.patch.object(DietIntake, "compute", side_effect=compute) as spy:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.plans[1].set_foods([self.pear.pk, self.bread.pk])
+                self.plans[2].set_foods([])
+        self.assertEqual(spy.call_count, 1)
+        self.assertIntake()
+
+
+class PaginationTest(TestCase):
+    def setUp(self):
+        response_cache.backend.clear()
+        self.ids = [create_food(f"food{i}").pk for i in range(5)]
+
+    def page(self, query_id: str, after=None):
+        path = f"/api/us/food/all/@{query_id}?fields=food_id"
+        response = self.client.get(path + (f"&after={after}" if after else ""))
+        return response.status_code, response.json()
+
+    def ids_of(self, page: dict):
+        return [i["food_id"] for i in page["results"]]
+
+    def test_offset_pages(self):
+        _, first = self.page("0:2")
+        self.assertEqual(self.ids_of(first), self.ids[:2])
+        self.assertEqual((first["overflow"], first["after"]), (3, self.ids[1]))
+
+        _, last = self.page("2:2")
+        self.assertEqual(self.ids_of(last), self.ids[4:])
+        self.assertEqual((last["overflow"], last["after"]), (0, None))
+
+        _, empty = self.page("9:2")
+        self.assertEqual(empty["results"], [])
+
+    def test_cursor_pages(self):
+        seen, after = [], None
+        while True:
+            _, page = self.page("0:2", after)
+            seen += self.ids_of(page)
+            after = page["after"]
+            if after is None:
+                break
+        self.assertEqual(seen, self.ids)
+
+        # The cursor ignores the page number and survives deleted rows
+        Food.objects.filter(pk=self.ids[2]).delete()
+        _, page = self.page("7:2", self.ids[1])
+        self.assertEqual(self.ids_of(page), self.ids[3:5])
+
+    def test_size_is_clamped(self):
+        with mock.patch("api.views.PAGE_SIZE_LIMIT", 2):
+            _, page = self.page("0:1000")
+        self.assertEqual(self.ids_of(page), self.ids[:2])
+        self.assertEqual((page["overflow"], page["after"]), (3, self.ids[1]))
+
+    def test_invalid_pages(self):
+        for query_id, after in [("0", None), ("a:2", None), ("0:2", "abc")]:
+            self.assertEqual(self.page(query_id, after)[0], 409)
+
+    def test_overflow_is_bounded(self):
+        with mock.patch("api.utils.pagination.OVERFLOW_LIMIT", 2):
+            page = paginate(Food.objects.all(), 0, 1)
+        self.assertEqual([i.pk for i in page.rows], self.ids[:1])
+        self.assertEqual(page.overflow, 2)
+
+
+class FoodWriteTest(TestCase):
+    headers = {"AUTHORIZATION": "@manager:password"}
+
+    def setUp(self):
+        create_user("manager", role=1)
+
+    def post(self, path: str, data: dict):
+        return self.client.post(
+            f"/api/us/food/{path}",
+            data,
+            content_type="application/json",
+            headers=self.headers,
+        )
+
+    def create(self, vitamins: dict):
+        return self.post(
+            "create",
+            {
+                "name": "apple",
+                "description": "",
+                "photo_url": "https://example.com",
+                "carbs": 1,
+                "protein": 1,
+                "fat": 1,
+                "calories": 1,
+                "vitamins": vitamins,
+                "minerals": {},
+                "amino_acids": {},
+            },
+        )
+
+    def test_blank_nutrients(self):
+        for vitamins in [{"vitamin_c": ""}, {"vitamin_c": None}, {"vitamin_c": "3.5"}]:
+            response = self.create(vitamins)
+            self.assertEqual(response.status_code, 200)
+            food_id = response.json()["food_id"]
+            response = self.post("edit", {"food_id": food_id, "vitamins": vitamins})
+            self.assertEqual(response.status_code, 200)
+
+        vitamins = Nutrition.objects.order_by("pk").values_list("vitamins", flat=True)
+        self.assertEqual(
+            list(vitamins),
+            [{"vitamin_c": 0.0}, {"vitamin_c": None}, {"vitamin_c": 3.5}],
+        )
+        # Rows stored before values were parsed
+        vector = nutrients.unpack(
+            nutrients.pack(
+                dict.fromkeys(nutrients.MACROS, 1.0),
+                {"vitamins": {"vitamin_c": "", "vitamin_a": None}},
+            )
+        )
+        self.assertTrue(math.isnan(vector[nutrients.INDEX["vitamin_c"]]))
+
+    def test_failed_create_leaves_no_nutrition(self):
+        with mock.patch.object(Food, "pack_nutrients", side_effect=ValueError):
+            with self.assertRaises(ValueError):
+                self.create({})
+        self.assertFalse(Nutrition.objects.exists())
@@ -2,3 +2,10 @@ from .view import *
 from .lang import *
 from .validators import *
 from .password import *
+from .pagination import *
+from .cache import *
+from .conditional import *
+from .fieldset import *
+from .export import *
+from .restore import *
+from .routing import *
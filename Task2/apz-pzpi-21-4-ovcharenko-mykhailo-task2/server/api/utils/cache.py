@@ -0,0 +1,197 @@
+import copy
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+
+from .conditional import get_body_etag
+from .restore import rows_restored
+
+
+class LocalCache:
+    def __init__(self, max_size: int = 1024, ttl: float = 60.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._items: OrderedDict[str, tuple[float, object]] = OrderedDict()
+
+    def get(self, key: str):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            if item[0] < time.monotonic():
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return item[1]
+
+    def set(self, key: str, value):
+        with self._lock:
+            self._items[key] = (time.monotonic() + self.ttl, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._items.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
+
+
+class SharedCache:
+    def __init__(self, alias: str, ttl: float = 60.0, prefix: str = ""):
+        self.alias = alias
+        self.ttl = ttl
+        self.prefix = prefix
+
+    @property
+    def _cache(self):
+        return caches[self.alias]
+
+    def get(self, key: str):
+        return self._cache.get(self.prefix + key)
+
+    def set(self, key: str, value):
+        self._cache.set(self.prefix + key, value, timeout=self.ttl)
+
+    def delete(self, key: str):
+        self._cache.delete(self.prefix + key)
+
+    def __len__(self):
+        return 0
+
+
+def create_cache(config: dict, prefix: str = ""):
+    backend = config.get("BACKEND", "local")
+    if backend == "local":
+        return LocalCache(config.get("MAX_SIZE", 1024), config.get("TTL", 60.0))
+    if settings.CACHES.get(backend, {}).get("BACKEND", "").endswith(".DatabaseCache"):
+        # Async views call get/set on the event loop, where the ORM refuses
+        raise ImproperlyConfigured(f"Cache {backend!r} is backed by the database")
+    return SharedCache(backend, config.get("TTL", 60.0), prefix)
+
+
+class UserCache:
+    def __init__(self, config: dict):
+        self.backend = create_cache(config, prefix="user:")
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, user_id: str, password: str):
+        # Handlers modify and save the user they get, every request gets its
+        # own copy so the cached one stays as it was loaded
+        user = self.backend.get(user_id)
+        if user is None or user.password != password:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return copy.deepcopy(user)
+
+    def set(self, user):
+        self.backend.set(user.user_id, copy.deepcopy(user))
+
+    def invalidate(self, user_id: str):
+        self.backend.delete(user_id)
+
+    @property
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self.backend),
+        }
+
+
+class ResponseCache:
+    def __init__(self, config: dict):
+        self.backend = create_cache(config, prefix="response:")
+        self.resources: dict[type, set[str]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def watch(self, resource: str, models: list):
+        for model in models:
+            self.resources.setdefault(model, set()).add(resource)
+            for signal in [post_save, post_delete, rows_restored]:
+                signal.connect(
+                    self._changed,
+                    sender=model,
+                    weak=False,
+                    dispatch_uid=f"response_cache.{model.__name__}",
+                )
+
+    def _changed(self, sender, using=None, **kwargs):
+        # A GET running before the commit still reads the old rows, so the
+        # generation only moves once they are visible
+        for resource in self.resources.get(sender, []):
+            transaction.on_commit(
+                lambda resource=resource: self.invalidate(resource), using=using
+            )
+
+    def _generation(self, resource: str):
+        # Entries are keyed under a per-resource generation, so invalidating
+        # a resource is a single write instead of a key scan
+        generation = self.backend.get(f"{resource}:generation")
+        if generation is None:
+            generation = uuid.uuid4().hex
+            self.backend.set(f"{resource}:generation", generation)
+        return generation
+
+    def get(self, resource: str, key: str) -> tuple[str, tuple | None]:
+        # The generation is handed back to set(), a response built while a
+        # write invalidated the resource is stored where nobody looks
+        generation = self._generation(resource)
+        entry = self.backend.get(f"{resource}:{generation}:{key}")
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return generation, entry
+
+    def set(
+        self,
+        resource: str,
+        key: str,
+        generation: str,
+        data,
+        etag: str | None = None,
+        last_modified: int | None = None,
+    ) -> tuple[str, int | None]:
+        if etag is None:
+            etag = get_body_etag(data)
+        self.backend.set(
+            f"{resource}:{generation}:{key}",
+            (etag, last_modified, data),
+        )
+        return etag, last_modified
+
+    def invalidate(self, resource: str):
+        self.backend.set(f"{resource}:generation", uuid.uuid4().hex)
+
+    @property
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self.backend),
+        }
+
+
+user_cache = UserCache(getattr(settings, "USER_CACHE", {}))
+response_cache = ResponseCache(getattr(settings, "RESPONSE_CACHE", {}))
@@ -0,0 +1,83 @@
+import hashlib
+import json
+import math
+
+from django.db.models import Model
+from django.utils.http import http_date, parse_http_date_safe, parse_etags
+
+
+def get_etag(*parts) -> str:
+    return f'W/"{hashlib.sha1(repr(parts).encode()).hexdigest()}"'
+
+
+def get_body_etag(data) -> str:
+    body = json.dumps(data, sort_keys=True, default=str).encode()
+    return f'"{hashlib.sha1(body).hexdigest()}"'
+
+
+def get_row_validators(path: str, row) -> tuple[str, int | None] | None:
+    if row is None:
+        return None
+    versions = [i.timestamp() for i in row if i is not None]
+    return get_etag(path, row), math.ceil(max(versions)) if versions else None
+
+
+def has_conditions(request) -> bool:
+    return bool(
+        request.headers.get("If-None-Match") or request.headers.get("If-Modified-Since")
+    )
+
+
+def get_validators(
+    model: type[Model], fields: list[str], name: str, path: str, query_id
+) -> tuple[str, int | None] | None:
+    # Versions are read with values_list so nothing is serialized for a 304.
+    # Pages are validated by their body, the rows are loaded by the handler.
+    if name != "query":
+        return None
+    try:
+        row = model.objects.filter(pk=query_id).values_list(*fields).first()  # type: ignore
+    except (ValueError, TypeError):
+        return None
+    return get_row_validators(path, row)
+
+
+async def aget_validators(
+    model: type[Model], fields: list[str], name: str, path: str, query_id
+) -> tuple[str, int | None] | None:
+    if name != "query":
+        return None
+    try:
+        row = await model.objects.filter(pk=query_id).values_list(*fields).afirst()  # type: ignore
+    except (ValueError, TypeError):
+        return None
+    return get_row_validators(path, row)
+
+
+def is_not_modified(request, etag: str | None, last_modified: int | None) -> bool:
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match:
+        if not etag:
+            return False
+        tags = [i.removeprefix("W/") for i in parse_etags(if_none_match)]
+        return "*" in tags or etag.removeprefix("W/") in tags
+
+    # Dates have one second resolution and miss writes within the same second,
+    # so they are only trusted for responses without an ETag
+    if etag:
+        return False
+    if_modified_since = parse_http_date_safe(
+        request.headers.get("If-Modified-Since") or ""
+    )
+    return bool(
+        last_modified and if_modified_since and last_modified <= if_modified_since
+    )
+
+
+def get_headers(etag: str | None, last_modified: int | None) -> dict:
+    headers = {"Access-Control-Allow-Origin": "*"}
+    if etag:
+        headers["ETag"] = etag
+    if last_modified:
+        headers["Last-Modified"] = http_date(last_modified)
+    return headers
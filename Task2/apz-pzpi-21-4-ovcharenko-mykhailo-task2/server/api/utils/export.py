@@ -0,0 +1,68 @@
+import csv
+import io
+import zlib
+
+from asgiref.sync import sync_to_async
+from django.db.models import QuerySet
+from django.http import StreamingHttpResponse
+from import_export.resources import ModelResource
+
+BACKUP_CHUNK_SIZE = 2000
+
+
+def iter_csv(resource: ModelResource, queryset: QuerySet, chunk_size: int):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(resource.get_export_headers())
+    for i, instance in enumerate(queryset.iterator(chunk_size=chunk_size), 1):
+        writer.writerow(resource.export_resource(instance))
+        if i % chunk_size == 0:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode("utf-8")
+
+
+def iter_gzip(chunks):
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+async def aiter_chunks(chunks):
+    # ASGI buffers sync iterators whole, so chunks are pulled one at a time on
+    # the thread that runs sync code, which keeps the cursor on one connection
+    done = object()
+    get_next = sync_to_async(next)
+    while (chunk := await get_next(chunks, done)) is not done:
+        yield chunk
+
+
+def stream_csv(
+    resource: ModelResource,
+    filename: str,
+    compress: bool = False,
+    chunk_size: int = BACKUP_CHUNK_SIZE,
+    is_async: bool = False,
+    using: str = "default",
+):
+    # The response is iterated after the view returned, so the database the
+    # view read from is bound to the queryset here
+    queryset = resource.get_queryset().using(using)
+    chunks = iter_csv(resource, queryset, chunk_size)
+    if compress:
+        chunks = iter_gzip(chunks)
+    response = StreamingHttpResponse(
+        aiter_chunks(chunks) if is_async else chunks,
+        content_type="text/csv; charset=utf-8",
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}.csv"',
+            "Vary": "Accept-Encoding",
+        },
+    )
+    if compress:
+        response["Content-Encoding"] = "gzip"
+    return response
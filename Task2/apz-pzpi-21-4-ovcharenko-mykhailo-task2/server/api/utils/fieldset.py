@@ -0,0 +1,11 @@
+def parse_fieldset(value: str | None) -> dict | None:
+    # "a,b.c,b.d" -> {"a": {}, "b": {"c": {}, "d": {}}}
+    if value is None:
+        return None
+    tree = {}
+    for path in value.split(","):
+        node = tree
+        for part in path.strip().split("."):
+            if part:
+                node = node.setdefault(part, {})
+    return tree
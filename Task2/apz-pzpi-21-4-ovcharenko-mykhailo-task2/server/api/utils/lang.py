@@ -10,6 +10,8 @@ TRANSLATIONS = {
         "user.not_authenticated": "You must be authenticated to access this page.",
         "user.no_permission": "You don't have permissions to access this page.",
         "generic.not_found": "Not found.",
+        "generic.busy": "Server is busy, try again later.",
+        "generic.server_error": "Something went wrong, try again later.",
         "role.0": "User",
         "role.1": "Manager",
         "role.2": "Admin",
@@ -23,6 +25,8 @@ TRANSLATIONS = {
         "user.not_authenticated": "Вам потрібно автентифікуватися, щоб отримати доступ до цієї сторінки.",
         "user.no_permission": "У вас немає прав доступу до цієї сторінки.",
         "generic.not_found": "Не знайдено.",
+        "generic.busy": "Сервер зайнятий, спробуйте пізніше.",
+        "generic.server_error": "Щось пішло не так, спробуйте пізніше.",
         "role.0": "Користувач",
         "role.1": "Керівник",
         "role.2": "Адміністратор",
@@ -0,0 +1,67 @@
+from django.core.exceptions import ValidationError
+from django.db.models import QuerySet
+
+OVERFLOW_LIMIT = 100_000
+
+
+class Page:
+    def __init__(self, rows: list, overflow: int, after):
+        self.rows = rows
+        self.overflow = overflow
+        self.after = after
+
+
+def parse_page(query_id: str) -> tuple[int, int] | None:
+    parts = query_id.split(":")
+    if len(parts) != 2 or [True for part in parts if not part.isnumeric()]:
+        return None
+    return int(parts[0]), int(parts[1])
+
+
+def get_window(queryset: QuerySet, page: int, size: int, after=None):
+    # Stable ordering is required for both OFFSET and keyset windows
+    queryset = queryset.order_by("pk")
+    if after is not None:
+        return queryset.filter(pk__gt=after), 0
+    return queryset, page * size
+
+
+def get_overflow(queryset: QuerySet, start: int, size: int) -> int:
+    return queryset[start + size : start + size + OVERFLOW_LIMIT].count()
+
+
+async def aget_overflow(queryset: QuerySet, start: int, size: int) -> int:
+    return await queryset[start + size : start + size + OVERFLOW_LIMIT].acount()
+
+
+def paginate(queryset: QuerySet, page: int, size: int, after=None) -> Page:
+    queryset, start = get_window(queryset, page, size, after)
+
+    # Probe one row past the window instead of counting the whole table
+    rows = list(queryset[start : start + size + 1])
+    overflow = 0
+    if len(rows) > size:
+        rows = rows[:size]
+        overflow = get_overflow(queryset, start, size)
+
+    return Page(rows, overflow, rows[-1].pk if rows and overflow else None)
+
+
+async def apaginate(queryset: QuerySet, page: int, size: int, after=None) -> Page:
+    queryset, start = get_window(queryset, page, size, after)
+
+    rows = [i async for i in queryset[start : start + size + 1]]
+    overflow = 0
+    if len(rows) > size:
+        rows = rows[:size]
+        overflow = await aget_overflow(queryset, start, size)
+
+    return Page(rows, overflow, rows[-1].pk if rows and overflow else None)
+
+
+def is_valid_cursor(queryset: QuerySet, after) -> bool:
+    try:
+        queryset.model._meta.pk.to_python(after)
+    except (ValueError, ValidationError):
+        return False
+    return True
@@ -1,4 +1,9 @@
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+
 import bcrypt
+from django.conf import settings
 
 
 class Password:
@@ -11,3 +16,68 @@ class Password:
         return bcrypt.checkpw(
             bytes(password, encoding="utf-8"), bytes(hashed, encoding="utf-8")
         )
+
+
+class PoolSaturated(Exception):
+    pass
+
+
+class HashPool:
+    def __init__(self, kind: str = "thread", workers: int = 4, max_queue: int = 32):
+        self.kind = kind
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor: Executor | None = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(workers + max_queue)
+        self.count = 0
+        self.rejected = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+
+    @property
+    def executor(self) -> Executor:
+        with self._lock:
+            if self._executor is None:
+                if self.kind == "process":
+                    self._executor = ProcessPoolExecutor(self.workers)
+                else:
+                    self._executor = ThreadPoolExecutor(
+                        self.workers, thread_name_prefix="bcrypt"
+                    )
+            return self._executor
+
+    def run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise PoolSaturated()
+        try:
+            start = time.perf_counter()
+            result = self.executor.submit(fn, *args).result()
+            elapsed = time.perf_counter() - start
+        finally:
+            self._slots.release()
+
+        with self._lock:
+            self.count += 1
+            self.total_time += elapsed
+            self.max_time = max(self.max_time, elapsed)
+        return result
+
+    @property
+    def stats(self):
+        with self._lock:
+            return {
+                "count": self.count,
+                "rejected": self.rejected,
+                "average_ms": self.total_time / self.count * 1000
+                if self.count
+                else 0.0,
+                "max_ms": self.max_time * 1000,
+            }
+
+
+password_pool = HashPool(
+    **{k.lower(): v for k, v in getattr(settings, "PASSWORD_POOL", {}).items()}
+)
@@ -0,0 +1,134 @@
+import csv
+import io
+from itertools import islice
+
+from django.db import DatabaseError, transaction
+from django.dispatch import Signal
+from django.utils import timezone
+from import_export.resources import ModelResource
+from import_export.widgets import ForeignKeyWidget, ManyToManyWidget
+
+RESTORE_BATCH_SIZE = 500
+
+# Sent after every committed batch, bulk writes bypass post_save
+rows_restored = Signal()
+
+
+def parse_row(model, fields: list, row: dict):
+    instance = model()
+    relations = {}
+    for field in fields:
+        if field.column_name not in row:
+            continue
+        value = row[field.column_name]
+        model_field = model._meta.get_field(field.attribute)
+        if isinstance(field.widget, ManyToManyWidget):
+            to_python = model_field.related_model._meta.pk.to_python
+            relations[model_field] = [to_python(i) for i in value.split(",") if i]
+        elif isinstance(field.widget, ForeignKeyWidget):
+            setattr(
+                instance,
+                model_field.attname,
+                model_field.target_field.to_python(value) if value else None,
+            )
+        else:
+            setattr(instance, field.attribute, field.clean(row))
+    return instance, relations
+
+
+def save_relations(rows: list[tuple]):
+    for model_field in {field for _, relations in rows for field in relations}:
+        through = model_field.remote_field.through
+        source = model_field.m2m_field_name()
+        target = model_field.m2m_reverse_field_name()
+        ordered = "position" in [i.name for i in through._meta.fields]
+        related = {
+            instance.pk: relations[model_field]
+            for instance, relations in rows
+            if model_field in relations
+        }
+
+        through.objects.filter(**{f"{source}__in": related.keys()}).delete()
+        through.objects.bulk_create(
+            [
+                through(
+                    **{f"{source}_id": pk, f"{target}_id": target_id},
+                    **({"position": i} if ordered else {}),
+                )
+                for pk, target_ids in related.items()
+                for i, target_id in enumerate(target_ids)
+            ]
+        )
+
+
+def restore_csv(
+    resource: ModelResource,
+    data: str,
+    batch_size: int = RESTORE_BATCH_SIZE,
+    dry_run: bool = False,
+):
+    model = resource._meta.model
+    reader = csv.DictReader(io.StringIO(data))
+    fields = [i for i in resource.get_import_fields() if i.attribute]
+    # Existing rows only get the columns the CSV has, like import_data did,
+    # model defaults are only used for rows being created
+    update_fields = [
+        i.attribute
+        for i in fields
+        if not isinstance(i.widget, ManyToManyWidget)
+        and i.attribute != model._meta.pk.name
+        and i.column_name in (reader.fieldnames or [])
+    ]
+    auto_now = [i.name for i in model._meta.fields if getattr(i, "auto_now", False)]
+    update_fields += [i for i in auto_now if i not in update_fields]
+    report = {"dry_run": dry_run, "rows": 0, "created": 0, "updated": 0}
+    batches = []
+
+    rows_read = enumerate(reader, 1)
+    while chunk := list(islice(rows_read, batch_size)):
+        batch = {"batch": len(batches), "rows": len(chunk), "errors": []}
+        batches.append(batch)
+
+        rows = []
+        for index, row in chunk:
+            try:
+                rows.append(parse_row(model, fields, row))
+            except Exception as e:
+                batch["errors"].append({"row": index, "error": str(e)})
+
+        instances = [instance for instance, _ in rows]
+        # bulk writes skip pre_save, so auto_now versions are stamped here
+        for field in auto_now:
+            for instance in instances:
+                setattr(instance, field, timezone.now())
+        existing = set(
+            model.objects.filter(
+                pk__in=[i.pk for i in instances if i.pk is not None]
+            ).values_list("pk", flat=True)
+        )
+        created = [i for i in instances if i.pk not in existing]
+        updated = [i for i in instances if i.pk in existing]
+        try:
+            with transaction.atomic():
+                model.objects.bulk_create(created)
+                if updated and update_fields:
+                    model.objects.bulk_update(updated, update_fields)
+                save_relations(rows)
+                if dry_run:
+                    transaction.set_rollback(True)
+                else:
+                    rows_restored.send(sender=model, instances=instances)
+        except (DatabaseError, ValueError) as e:
+            batch["errors"].append({"row": None, "error": str(e)})
+            continue
+
+        batch["created"], batch["updated"] = len(created), len(updated)
+        report["rows"] += len(instances)
+        report["created"] += len(created)
+        report["updated"] += len(updated)
+
+    return {
+        "has_errors": any(i["errors"] for i in batches),
+        **report,
+        "batches": batches,
+    }
@@ -0,0 +1,64 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+
+from .cache import create_cache
+
+READ_REPLICAS = getattr(settings, "READ_REPLICAS", {})
+
+# The replica a View GET handler reads from, picked once per request so all
+# of its queries see one snapshot. sync_to_async carries it to the ORM.
+replica_reads: ContextVar[str | None] = ContextVar("replica_reads", default=None)
+
+
+@contextmanager
+def read_from_replicas(enabled: bool):
+    aliases = READ_REPLICAS.get("ALIASES")
+    token = replica_reads.set(random.choice(aliases) if enabled and aliases else None)
+    try:
+        yield
+    finally:
+        replica_reads.reset(token)
+
+
+class StickyUsers:
+    # Users who wrote within the last TTL seconds keep reading from default
+    def __init__(self, config: dict):
+        self.backend = create_cache(config, prefix="sticky:")
+
+    def add(self, user_id: str):
+        self.backend.set(user_id, True)
+
+    def has(self, user_id: str | None):
+        return bool(user_id) and bool(self.backend.get(user_id))  # type: ignore
+
+
+sticky_users = StickyUsers(READ_REPLICAS)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        # Related rows come from wherever their instance was loaded
+        instance = hints.get("instance")
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        return replica_reads.get() or "default"
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+
+def sync_replicas(aliases: list[str] | None = None):
+    # Copies default into every SQLite replica with sqlite3's online backup
+    source = connections["default"]
+    source.ensure_connection()
+    for alias in READ_REPLICAS.get("ALIASES", []) if aliases is None else aliases:
+        target = connections[alias]
+        target.ensure_connection()
+        source.connection.backup(target.connection)
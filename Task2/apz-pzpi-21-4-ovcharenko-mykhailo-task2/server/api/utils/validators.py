@@ -6,61 +6,14 @@ from django.core.exceptions import ValidationError
 from django.core.validators import validate_email
 from django.http.response import json
 
-VITAMINS = [
-    "vitamin_a",
-    "vitamin_b6",
-    "vitamin_b12",
-    "vitamin_c",
-    "vitamin_d",
-    "vitamin_e",
-    "vitamin_k1",
-    "betaine",
-    "choline",
-    "folate",
-    "thiamin",
-    "riboflavin",
-    "pantothenic_acid",
-    "niacin",
-]
-
-MINERALS = [
-    "calcium",
-    "copper",
-    "fluoride",
-    "iron",
-    "magnesium",
-    "manganese",
-    "phosphorus",
-    "potassium",
-    "selenium",
-    "sodium",
-    "zinc",
-]
-
-AMINO_ACIDS = [
-    "alanine",
-    "arginine",
-    "aspartic_acid",
-    "cystine",
-    "glutamic_acid",
-    "glycine",
-    "histidine",
-    "isoleucine",
-    "leucine",
-    "lysine",
-    "methionine",
-    "phenylalanine",
-    "proline",
-    "serine",
-    "threonine",
-    "tyrosine",
-    "valine",
-]
+from api.nutrients import AMINO_ACIDS, MINERALS, VITAMINS
+
+# Returned by parse() for rejected input, validators keep no per-request state
+INVALID = object()
 
 
 class ValidValue:
     def __init__(self, is_optional: bool = False):
-        self.value = None
         self.is_optional = is_optional
 
     def __str__(self) -> str:
@@ -74,198 +27,289 @@ class ValidValue:
         return {
             k: v
             for k, v in self.__dict__.items()
-            if k not in ["value", "is_optional", "keys"]
+            if k not in ["is_optional", "keys", "fields", "model"]
         }
 
-    def validate(self, value: str) -> bool:
-        return True
+    def parse(self, value):
+        return value
+
+    def validate(self, value) -> bool:
+        return self.parse(value) is not INVALID
 
     def get_valid_value(
         self, add_error: Callable, data: dict, name: str, parent: str = ""
     ):
         error_name = ".".join([i for i in [parent, name] if i])
-        if data.get(name) is None:
+        value = data.get(name)
+        if value is None:
             if not self.is_optional:
                 add_error(error_name, "arg.not_found")
             return None
-        if not self.validate(data.get(name) or ""):
-            add_error(
-                error_name,
-                "arg.invalid_value",
-                self.__class__.__name__[5:],
-                "; ".join(
-                    [
-                        "=".join((key, str(value)))
-                        for key, value in self.variables.items()
-                    ]
-                ),
-            )
-        return self.value
-
-
-class ValidId(ValidValue):
-    def __init__(self, model, key: str, key_type: type, is_optional: bool = False):
+        value = self.parse(value)
+        if value is INVALID:
+            self.add_invalid(add_error, error_name)
+            return None
+        return value
+
+    def add_invalid(self, add_error: Callable, error_name: str):
+        add_error(
+            error_name,
+            "arg.invalid_value",
+            self.__class__.__name__[5:],
+            "; ".join(
+                ["=".join((key, str(value))) for key, value in self.variables.items()]
+            ),
+        )
+
+
+class ValidReference(ValidValue):
+    # parse() only converts keys, Args loads every referenced row per model in
+    # one query and hands them to resolve()
+    def __init__(self, model, key: str = "pk", is_optional: bool = False):
         self.model = model
         self.key = key
-        self.key_type = key_type
         super().__init__(is_optional)
 
-    def validate(self, value: str):
-        instance = self.model.secure_get(**{self.key: self.key_type(value)})
-        if not instance:
-            return False
-        self.value = instance
-        return True
+    def get_keys(self, value) -> list:
+        return [value]
+
+    def resolve(self, value, instances: dict):
+        return instances.get(value, INVALID)
+
+
+def check_schema(schema: dict[str, ValidValue]):
+    # Only top level Args fields are resolved, a nested reference would
+    # silently pass unchecked
+    for key, validator in schema.items():
+        if isinstance(validator, ValidReference) and validator.model:
+            raise TypeError(f"Model references can't be nested, found one in {key}")
+
+
+class ValidId(ValidReference):
+    def __init__(self, model, key: str, key_type: type, is_optional: bool = False):
+        self.key_type = key_type
+        super().__init__(model, key, is_optional)
+
+    def parse(self, value: str):
+        try:
+            return self.key_type(value)
+        except (ValueError, TypeError):
+            return INVALID
+
 
+class ValidText(ValidValue):
+    # JSON bodies can carry any type, text validators only look at strings
+    def parse(self, value: str):
+        if type(value) is not str:
+            return INVALID
+        return self.parse_text(value)
 
-class ValidString(ValidValue):
+    def parse_text(self, value: str):
+        return value
+
+
+class ValidString(ValidText):
     def __init__(self, max_length: int = 2147483648, is_optional: bool = False):
         self.max_length = max_length
         super().__init__(is_optional=is_optional)
 
-    def validate(self, value: str) -> bool:
-        self.value = value
-        return len(value) <= self.max_length
+    def parse_text(self, value: str):
+        return value if len(value) <= self.max_length else INVALID
 
 
 class ValidInteger(ValidValue):
-    def validate(self, value: str) -> bool:
+    def parse(self, value: str):
         try:
-            self.value = int(value or "0")
-        except ValueError:
-            return False
-        return True
+            return int(value or "0")
+        except (ValueError, TypeError):
+            return INVALID
 
 
 class ValidFloat(ValidValue):
-    def validate(self, value: str) -> bool:
+    def parse(self, value: str):
         try:
-            self.value = float(value or "0.0")
-        except ValueError:
-            return False
-        return True
+            return float(value or "0.0")
+        except (ValueError, TypeError):
+            return INVALID
+
+
+# Latest unix time datetime can represent (9999-12-31 23:59:59 UTC)
+MAX_TIMESTAMP = 253402300799.0
+
+
+class ValidTimestamp(ValidFloat):
+    def parse(self, value: str):
+        value = super().parse(value)
+        # NaN fails both comparisons, infinities fail the range
+        if value is INVALID or not 0 <= value <= MAX_TIMESTAMP:
+            return INVALID
+        return value
+
 
+INTEGER = ValidInteger()
+TIMESTAMP = ValidTimestamp()
 
-class ValidUrl(ValidValue):
-    def validate(self, value: str) -> bool:
-        self.value = value
-        return value.startswith("https://")
 
+class ValidUrl(ValidText):
+    def parse_text(self, value: str):
+        return value if value.startswith("https://") else INVALID
 
-class ValidPassword(ValidValue):
+
+class ValidPassword(ValidText):
     @staticmethod
     def _get_entropy(password: str):
         return math.log2(len(set(password)) ** len(password))
 
-    def validate(self, value: str) -> bool:
-        self.value = value
-        return self._get_entropy(value) >= 50
+    def parse_text(self, value: str):
+        return value if self._get_entropy(value) >= 50 else INVALID
 
 
-class ValidEmail(ValidValue):
-    def validate(self, value: str) -> bool:
+class ValidEmail(ValidText):
+    def parse_text(self, value: str):
         try:
             validate_email(value)
         except ValidationError:
-            return False
-        else:
-            self.value = value
-            return True
+            return INVALID
+        return value
 
 
-class ValidPhone(ValidValue):
-    def validate(self, value: str) -> bool:
+class ValidPhone(ValidText):
+    def parse_text(self, value: str):
         if not value.startswith("+") and value[1:].isnumeric() and len(value[1:]) < 16:
-            return False
+            return INVALID
+        return value
 
-        self.value = value
-        return True
 
-
-class ValidTime(ValidValue):
-    def validate(self, value: str) -> bool:
+class ValidTime(ValidText):
+    def parse_text(self, value: str):
         split_values = value.split(":")
 
-        if not len(split_values) == 3:
-            if len(split_values) == 2:
-                self.value = datetime.time(*[int(i) for i in [*split_values, "00"]])  # type: ignore
-                return True
-            return False
-
-        if False in [i.isnumeric() for i in split_values]:
-            return False
+        if len(split_values) == 2:
+            split_values.append("00")
+        if len(split_values) != 3 or False in [i.isnumeric() for i in split_values]:
+            return INVALID
 
-        self.value = datetime.time(*[int(i) for i in split_values])  # type: ignore
-        return True
+        try:
+            return datetime.time(*[int(i) for i in split_values])  # type: ignore
+        except ValueError:
+            return INVALID
 
 
-class ValidDate(ValidValue):
-    def validate(self, value: str) -> bool:
+class ValidDate(ValidText):
+    def parse_text(self, value: str):
         parts = value.split("-")
-        if len(parts) != 3:
-            return False
-
-        self.value = value
-        return (
-            ValidInteger().validate(parts[0])
-            and ValidInteger().validate(parts[1])
-            and ValidInteger().validate(parts[2])
-        )
+        if len(parts) != 3 or not all(INTEGER.validate(i) for i in parts):
+            return INVALID
+        return value
 
 
 class ValidJson(ValidValue):
     def __init__(
         self, schema: dict[str, ValidValue], is_optional=False, arbitrary=False
     ):
+        check_schema(schema)
         self.schema = schema
         self.keys = list(schema.keys())
         self.arbitrary = arbitrary
         super().__init__(is_optional)
 
-    def validate(self, value: str) -> bool:
+    def parse(self, value: str):
         try:
-            if type(value) is str:
-                self.value = json.loads(value)
-            else:
-                self.value = value
+            parsed = json.loads(value) if type(value) is str else value
             if self.arbitrary:
-                return True
-            for key, value in cast(dict, self.value).items():
+                return parsed
+            result = {}
+            for key, item in cast(dict, parsed).items():
                 if key not in self.keys:
-                    return False
-                if not self.schema[key].validate(value):
-                    return False
-        except Exception as e:
-            print(e)
-            return False
-        return True
+                    return INVALID
+                # null stays null, it marks the value as missing
+                if item is not None:
+                    item = self.schema[key].parse(item)
+                    if item is INVALID:
+                        return INVALID
+                result[key] = item
+        except (ValueError, AttributeError, TypeError):
+            return INVALID
+        return result
+
+
+class ValidRecords(ValidValue):
+    def __init__(
+        self,
+        schema: dict[str, ValidValue],
+        max_length: int = 1024,
+        is_optional: bool = False,
+    ):
+        check_schema(schema)
+        self.schema = schema
+        self.fields = tuple(schema.items())
+        self.max_length = max_length
+        super().__init__(is_optional)
+
+    def parse(self, value: str):
+        try:
+            records = json.loads(value) if type(value) is str else value
+            if type(records) is not list or len(records) > self.max_length:
+                return INVALID
+            result = []
+            for record in records:
+                parsed = {}
+                for key, validator in self.fields:
+                    item = record.get(key)
+                    if item is None:
+                        if validator.is_optional:
+                            parsed[key] = None
+                            continue
+                        return INVALID
+                    item = validator.parse(item)
+                    if item is INVALID:
+                        return INVALID
+                    parsed[key] = item
+                result.append(parsed)
+        except (ValueError, AttributeError, TypeError):
+            return INVALID
+        return result
 
 
 class ValidBoolean(ValidValue):
-    def validate(self, value: str) -> bool:
+    def parse(self, value: str):
         if type(value) is bool:
-            self.value = value
-            return True
+            return value
+        if type(value) is not str:
+            return INVALID
         if value.lower() == "true":
-            self.value = True
             return True
         if value.lower() == "false":
-            self.value = False
-            return True
-        return False
+            return False
+        return INVALID
 
 
 class ValidMealTime(ValidValue):
-    def validate(self, value: str | int) -> bool:
-        value = int(value)
-        self.value = value or 0
-        return self.value in [0, 1, 2, 3]
+    def parse(self, value: str | int):
+        try:
+            value = int(value)
+        except (ValueError, TypeError):
+            return INVALID
+        return value if value in [0, 1, 2, 3] else INVALID
+
 
+class ValidList(ValidReference):
+    # Without a model this is a plain list of integers
+    def __init__(self, model=None, key: str = "pk", is_optional: bool = False):
+        super().__init__(model, key, is_optional)
 
-class ValidList(ValidValue):
-    def validate(self, value: str) -> bool:
+    def parse(self, value: str):
         try:
-            self.value = [int(i) for i in value.split(",") if i]
+            if type(value) is not list:
+                value = value.split(",")
+            return [int(i) for i in value if i != ""]
         except:
-            return False
-        return True
+            return INVALID
+
+    def get_keys(self, value: list) -> list:
+        return value
+
+    def resolve(self, value: list, instances: dict):
+        if any(i not in instances for i in value):
+            return INVALID
+        return [instances[i] for i in value]
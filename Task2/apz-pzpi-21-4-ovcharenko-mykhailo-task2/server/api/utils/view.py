@@ -1,13 +1,30 @@
+import inspect
+import json
 from typing import Callable
 
+from asgiref.sync import sync_to_async
 from django.http import HttpResponse
+from django.http.response import HttpResponseBase
+from django.views.decorators.http import require_http_methods
 
 from api.models import User
 from django.urls import path
 from rest_framework.decorators import api_view
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 
+from .cache import response_cache, user_cache
+from .conditional import (
+    aget_validators,
+    get_headers,
+    get_validators,
+    has_conditions,
+    is_not_modified,
+)
+from .fieldset import parse_fieldset
 from .lang import Lang
+from .routing import read_from_replicas, sticky_users
+from .validators import INVALID, ValidReference, ValidValue
 
 
 def transform_name(name: str):
@@ -35,6 +52,9 @@ class GenClass:
 
 
 class Args(GenClass):
+    _plan: tuple = ()
+    has_references = False
+
     def __init__(self, lang: Lang):
         self.is_cancelled = False
         self.error = {}
@@ -61,28 +81,129 @@ class Args(GenClass):
         else:
             self.error[key] = self.lang.translate(message, *args)
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # Built once per class, validators are shared so they hold no state
+        cls._plan = tuple(
+            (name, tuple(validator.items()) if type(validator) is dict else validator)
+            for name, validator in cls._get_locals()
+            if isinstance(validator, (ValidValue, dict))
+        )
+        # References hit the database, async views validate them in a thread
+        validators = [
+            v
+            for _, validator in cls._plan
+            for v in (
+                [i for _, i in validator] if type(validator) is tuple else [validator]
+            )
+        ]
+        cls.has_references = any(
+            isinstance(v, ValidReference) and v.model for v in validators
+        )
+
     def validate_all(self, data: dict):
-        for name, validator in self.__class__._get_locals():
-            if type(validator) is dict:
-                updated = {}
-                for n, v in validator.items():
-                    updated[n] = v.get_valid_value(
-                        self.add_error, data.get(name, {}), n, parent=name
-                    )
-                setattr(self, name, updated)
+        fields = []
+        for name, validator in self._plan:
+            if type(validator) is tuple:
+                group = data.get(name, {})
+                values = {}
+                for n, v in validator:
+                    values[n] = v.get_valid_value(self.add_error, group, n, parent=name)
+                    fields.append((values, n, f"{name}.{n}", v))
+                setattr(self, name, values)
             else:
                 setattr(
                     self, name, validator.get_valid_value(self.add_error, data, name)
                 )
+                fields.append((self.__dict__, name, name, validator))
+
+        self._resolve(
+            [
+                (target, key, error_name, validator)
+                for target, key, error_name, validator in fields
+                if isinstance(validator, ValidReference)
+                and validator.model
+                and target[key] is not None
+            ]
+        )
         return self
 
+    def _resolve(self, references: list):
+        # One query per (model, key) for every id referenced by the request
+        keys = {}
+        for target, key, _, validator in references:
+            keys.setdefault((validator.model, validator.key), set()).update(
+                validator.get_keys(target[key])
+            )
+        instances = {
+            (model, key): {
+                getattr(i, key): i for i in model.objects.filter(**{f"{key}__in": ids})
+            }
+            for (model, key), ids in keys.items()
+        }
+
+        for target, key, error_name, validator in references:
+            value = validator.resolve(
+                target[key], instances[validator.model, validator.key]
+            )
+            if value is INVALID:
+                validator.add_invalid(self.add_error, error_name)
+                value = None
+            target[key] = value
+
 
 class View(GenClass):
-    def __init__(self, name: str, request, lang: str):
+    # Public GET handlers whose responses are cached until CACHE_MODELS change
+    CACHED: list[str] = []
+    CACHE_MODELS: list = []
+    # Row versions of MODEL that CACHED query handlers are validated with
+    MODEL = None
+    VERSION_FIELDS: list[str] = ["updated_at"]
+    # POST handlers that only read, they neither flush cached responses nor
+    # pin the user to the primary
+    READ_ONLY: list[str] = []
+
+    def __init__(self, name: str, request, lang: str, is_async: bool = False):
         self.name = name
         self.request = request
         self._body = request.data
         self.lang = Lang(lang)
+        self._is_async = is_async
+        self._user_id = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if cls.CACHE_MODELS:
+            response_cache.watch(cls._get_resource(), cls.CACHE_MODELS)
+
+    @classmethod
+    def _get_resource(cls):
+        return cls.__name__.lower().replace("view", "")
+
+    @property
+    def fieldset(self) -> dict:
+        params = self.request.query_params
+        return {
+            "fields": parse_fieldset(params.get("fields")),
+            "expand": parse_fieldset(params.get("expand")),
+        }
+
+    def _make_response(self, response, code: int, headers: dict):
+        if not self._is_async:
+            return Response(response, status=code, headers=headers)
+        # Async views bypass api_view, so the body is rendered here
+        return HttpResponse(
+            b"" if code == 304 else JSONRenderer().render(response),
+            status=code,
+            content_type="application/json",
+            headers=headers,
+        )
+
+    def _conditional(self, code: int, etag, last_modified, response):
+        headers = get_headers(etag, last_modified)
+        if is_not_modified(self.request, etag, last_modified):
+            return self._make_response(None, 304, headers)
+        return self._make_response(response, code, headers)
 
     @classmethod
     def _get_path(cls, fn: Callable, method: str, name: str):
@@ -92,15 +213,41 @@ class View(GenClass):
             and "query_id" in fn.__annotations__.keys()
         ):
             params.append(f"@<{fn.__annotations__['query_id'].__name__}:query_id>")
-        return path(
-            "/".join([cls.__name__.lower().replace("view", ""), name, *params]),
-            api_view([method])(
-                lambda request, lang, *args, **kwargs: cls(
-                    name, request, lang
-                )._respond(method.lower(), *args, **kwargs)
-            ),
-            name=name,
-        )
+        if inspect.iscoroutinefunction(fn):
+            view = require_http_methods([method])(cls._get_async_view(name, method))
+        else:
+            view = api_view([method])(cls._get_view(name, method))
+        return path("/".join([cls._get_resource(), name, *params]), view, name=name)
+
+    @classmethod
+    def _get_view(cls, name: str, method: str):
+        def view(request, lang, *args, **kwargs):
+            instance = cls(name, request, lang)
+            with instance._read_from(method):
+                return instance._respond(method.lower(), *args, **kwargs)
+
+        return view
+
+    @classmethod
+    def _get_async_view(cls, name: str, method: str):
+        async def view(request, lang, *args, **kwargs):
+            # Give the plain Django request the parts of DRF's Request we use
+            request.query_params = request.GET
+            request.data = request.POST
+            if request.content_type == "application/json":
+                try:
+                    request.data = json.loads(request.body or b"{}")
+                except ValueError as e:
+                    return HttpResponse(
+                        JSONRenderer().render({"detail": f"JSON parse error - {e}"}),
+                        status=400,
+                        content_type="application/json",
+                    )
+            instance = cls(name, request, lang, is_async=True)
+            with instance._read_from(method):
+                return await instance._arespond(method.lower(), *args, **kwargs)
+
+        return view
 
     @classmethod
     def get_url_patterns(cls):
@@ -108,28 +255,95 @@ class View(GenClass):
             cls._get_path(fn, *transform_name(name)) for name, fn in cls._get_locals()
         ]
 
+    def _get_credentials(self) -> tuple[str, str] | None:
+        token = self.request.headers.get("Authorization")
+        if not token or not is_token_valid(token):
+            return None
+        user_id, password = token.split(":")
+        return user_id[1:], password
+
+    def _read_from(self, method: str):
+        # Cached handlers read default: their responses are shared until a
+        # write invalidates them, nothing would when a replica catches up.
+        # Replicas may lag, so users who just wrote read their writes from
+        # default as well.
+        if method != "GET" or self.name in self.CACHED:
+            return read_from_replicas(False)
+        credentials = self._get_credentials()
+        return read_from_replicas(not sticky_users.has(credentials and credentials[0]))
+
+    def _authenticate(self):
+        credentials = self._get_credentials()
+        if not credentials:
+            return None
+        user = user_cache.get(*credentials)
+        if not user:
+            # Replicas may not have the user yet
+            with read_from_replicas(False):
+                user = User.secure_get(user_id=credentials[0], password=credentials[1])
+            if user:
+                user_cache.set(user)
+        return user
+
+    async def _aauthenticate(self):
+        credentials = self._get_credentials()
+        if not credentials:
+            return None
+        user = user_cache.get(*credentials)
+        if not user:
+            with read_from_replicas(False):
+                user = await User.objects.filter(
+                    user_id=credentials[0], password=credentials[1]
+                ).afirst()
+            if user:
+                user_cache.set(user)
+        return user
+
+    def _unauthenticated(self):
+        return self._make_response(
+            {"error": self.lang.translate("user.not_authenticated")},
+            401,
+            {"Access-Control-Allow-Origin": "*"},
+        )
+
+    def _get_cache_key(self, method: str):
+        if method == "get" and self.name in self.CACHED:
+            return self.request.get_full_path()
+        return None
+
+    def _get_version_args(self, cache_key: str, kwargs: dict):
+        return (
+            self.MODEL,
+            self.VERSION_FIELDS,
+            self.name,
+            cache_key,
+            kwargs.get("query_id"),
+        )
+
     def _respond(self, method: str, *args, **kwargs):
         fn: Callable = getattr(self, "_".join([method, self.name]))
 
-        # Authenticate
         if fn.__annotations__.get("user"):
-            token = self.request.headers.get("Authorization")
-            if not token or not is_token_valid(token):
-                return Response(
-                    {"error": self.lang.translate("user.not_authenticated")},
-                    status=401,
-                    headers={"Access-Control-Allow-Origin": "*"},
-                )
-            user_id, password = token.split(":")
-            user = User.secure_get(user_id=user_id[1:], password=password)
+            user = self._authenticate()
             if not user:
-                return Response(
-                    {"error": self.lang.translate("user.not_authenticated")},
-                    status=401,
-                    headers={"Access-Control-Allow-Origin": "*"},
-                )
+                return self._unauthenticated()
+            self._user_id = user.user_id
             args = [user, *args]
 
+        cache_key = self._get_cache_key(method)
+        validators, generation = (None, None), None
+        if cache_key:
+            generation, cached = response_cache.get(self._get_resource(), cache_key)
+            if cached:
+                return self._conditional(200, *cached)
+            # Only a single row is checked up front, and only when asked to
+            if self.MODEL is not None and has_conditions(self.request):
+                validators = get_validators(
+                    *self._get_version_args(cache_key, kwargs)
+                ) or (None, None)
+                if is_not_modified(self.request, *validators):
+                    return self._conditional(200, *validators, None)
+
         if method == "post":
             view_args: Args = fn.__annotations__["post"](self.lang)
             if view_args.validate_all(self._body).is_cancelled:
@@ -138,8 +352,70 @@ class View(GenClass):
                 code, response = fn(view_args, *args, **kwargs)
         else:
             code, response = fn(*args, **kwargs)
+        if cache_key and code == 200 and validators[0] is None and self.MODEL:
+            validators = get_validators(
+                *self._get_version_args(cache_key, kwargs)
+            ) or (None, None)
+        return self._finish(method, code, response, cache_key, validators, generation)
+
+    async def _arespond(self, method: str, *args, **kwargs):
+        fn: Callable = getattr(self, "_".join([method, self.name]))
+
+        if fn.__annotations__.get("user"):
+            user = await self._aauthenticate()
+            if not user:
+                return self._unauthenticated()
+            self._user_id = user.user_id
+            args = [user, *args]
+
+        cache_key = self._get_cache_key(method)
+        validators, generation = (None, None), None
+        if cache_key:
+            generation, cached = response_cache.get(self._get_resource(), cache_key)
+            if cached:
+                return self._conditional(200, *cached)
+            # Only a single row is checked up front, and only when asked to
+            if self.MODEL is not None and has_conditions(self.request):
+                validators = await aget_validators(
+                    *self._get_version_args(cache_key, kwargs)
+                ) or (None, None)
+                if is_not_modified(self.request, *validators):
+                    return self._conditional(200, *validators, None)
+
+        if method == "post":
+            view_args: Args = fn.__annotations__["post"](self.lang)
+            if view_args.has_references:
+                await sync_to_async(view_args.validate_all)(self._body)
+            else:
+                view_args.validate_all(self._body)
+            if view_args.is_cancelled:
+                code, response = 400, {"error": view_args.error}
+            else:
+                code, response = await fn(view_args, *args, **kwargs)
+        else:
+            code, response = await fn(*args, **kwargs)
+        if cache_key and code == 200 and validators[0] is None and self.MODEL:
+            validators = await aget_validators(
+                *self._get_version_args(cache_key, kwargs)
+            ) or (None, None)
+        return self._finish(method, code, response, cache_key, validators, generation)
+
+    def _finish(
+        self, method: str, code: int, response, cache_key, validators, generation
+    ):
+        is_write = method != "get" and self.name not in self.READ_ONLY
+        if is_write and code == 200 and self.CACHE_MODELS:
+            response_cache.invalidate(self._get_resource())
+        if is_write and code in [200, 201] and self._user_id:
+            sticky_users.add(self._user_id)
+        if cache_key and code == 200:
+            validators = response_cache.set(
+                self._get_resource(), cache_key, generation, response, *validators
+            )
+            return self._conditional(code, *validators, response)
+        if code == 201 and isinstance(response, HttpResponseBase):
+            response["Access-Control-Allow-Origin"] = "*"
+            return response
         if code == 201:
             return HttpResponse(response, headers={"Access-Control-Allow-Origin": "*"})  # type: ignore
-        return Response(
-            response, status=code, headers={"Access-Control-Allow-Origin": "*"}
-        )
+        return self._make_response(response, code, {"Access-Control-Allow-Origin": "*"})
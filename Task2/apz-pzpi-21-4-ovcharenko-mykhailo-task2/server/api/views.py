@@ -1,13 +1,38 @@
 from typing import Union
 
-import tablib
-from rest_framework.serializers import ModelSerializer
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.handlers.asgi import ASGIRequest
+from django.db import router, transaction
+from django.db.models import QuerySet
+from django.utils import timezone
 
 from .admin import *
-from .models import Diet, Food, MealPlan, Nutrition, Profile, Submission
+from .models import (
+    ROLLUP_RESOLUTIONS,
+    VITALS,
+    Diet,
+    DietIntake,
+    Food,
+    MealPlan,
+    Nutrition,
+    Profile,
+    Submission,
+    VitalsReading,
+    VitalsRollup,
+)
+from .nutrients import NUTRIENTS
+from .search import diet_text_index, food_text_index, search_foods
 from .serializers import *
+from .vitals import vitals_buffer
 from .utils import *
 
+BATCH_FETCH_LIMIT = settings.BATCH_FETCH_LIMIT
+PAGE_SIZE_LIMIT = settings.PAGE_SIZE_LIMIT
+IOT_BATCH_SIZE = 4096
+VITALS_POINT_LIMIT = 10_000
+SEARCH_LIMIT = 100
+
 
 def get_user(user_id: str, lang) -> tuple[int, Union[dict, User]]:
     query_user: User = User.secure_get(user_id=user_id)
@@ -18,23 +43,74 @@ def get_user(user_id: str, lang) -> tuple[int, Union[dict, User]]:
     return 200, query_user
 
 
-def get_all(
-    query_id: str, results: list, serializer: type[ModelSerializer], lang: Lang
+async def get_all(
+    query_id: str,
+    results: QuerySet,
+    serializer: type[PlannedSerializer],
+    lang: Lang,
+    after: str | None = None,
+    fieldset: dict | None = None,
 ):
-    parts = query_id.split(":")
-    if len(parts) != 2 and [True for part in parts if not part.isnumeric()]:
+    parsed = parse_page(query_id)
+    if parsed is None or (after is not None and not is_valid_cursor(results, after)):
         return 409, {
             "error": "Invalid format, must be: `[page]:[size]`",
         }
-    page, size = int(parts[0]), int(parts[1])
+    number, size = parsed
+    page = await apaginate(
+        serializer.plan(results), number, min(size, PAGE_SIZE_LIMIT), after=after
+    )
     return 200, {
-        "overflow": max(0, len(results) - (page * size) - size),
+        "overflow": page.overflow,
+        "after": page.after,
         "results": [
-            serializer(lang, food).data for food in results[page : page + size]
+            serializer(lang, row, **(fieldset or {})).data
+            for row in await serializer.aprefetch(page.rows, **(fieldset or {}))
         ],
     }
 
 
+async def get_many(
+    query_id: str,
+    results: QuerySet,
+    serializer: type[PlannedSerializer],
+    lang: Lang,
+    fieldset: dict | None = None,
+):
+    to_python = results.model._meta.pk.to_python
+    try:
+        ids = list(dict.fromkeys(to_python(i) for i in query_id.split(",") if i))
+    except (ValueError, ValidationError):
+        ids = []
+    if not ids or len(ids) > BATCH_FETCH_LIMIT:
+        return 409, {
+            "error": f"Invalid format, must be: `[id],[id],...` "
+            f"with at most {BATCH_FETCH_LIMIT} ids",
+        }
+
+    rows = await serializer.plan(results).ain_bulk(ids)
+    found = await serializer.aprefetch(
+        [rows[i] for i in ids if i in rows], **(fieldset or {})
+    )
+    return 200, {
+        "results": [serializer(lang, row, **(fieldset or {})).data for row in found],
+        "missing": [i for i in ids if i not in rows],
+    }
+
+
+async def record_readings(readings: list[dict]):
+    users = {i["user_id"] for i in readings}
+    known = {
+        i
+        async for i in User.objects.filter(user_id__in=users).values_list(
+            "user_id", flat=True
+        )
+    }
+    accepted = [i for i in readings if i["user_id"] in known]
+    await vitals_buffer.asubmit(accepted)
+    return {"accepted": len(accepted), "unknown": sorted(users - known)}
+
+
 class AccountView(View):
     class Register(Args):
         user_id: str = ValidString(16)  # type: ignore
@@ -50,11 +126,17 @@ class AccountView(View):
                 "error": self.lang.translate("user.already_exists", post.user_id)
             }
 
+        try:
+            hashed = password_pool.run(Password.encrypt, post.password)
+        except PoolSaturated:
+            return 429, {"error": self.lang.translate("generic.busy")}
+
         user = User(**post.as_dict(filters=["password", "date_of_birth"]))
         user.date_of_birth = datetime.datetime(*[int(i) for i in post.date_of_birth.split("-")])  # type: ignore
-        user.password = str(Password.encrypt(post.password), encoding="utf-8")  # type: ignore
+        user.password = str(hashed, encoding="utf-8")  # type: ignore
         user.save()
 
+        self._user_id = user.user_id
         return 200, {"token": user.token}
 
     class Login(Args):
@@ -66,9 +148,18 @@ class AccountView(View):
         if not user:
             return 404, {"error": self.lang.translate("user.not_found", post.user_id)}
 
-        if not Password.compare(str(user.password), post.password):
+        try:
+            is_valid = password_pool.run(
+                Password.compare, str(user.password), post.password
+            )
+        except PoolSaturated:
+            return 429, {"error": self.lang.translate("generic.busy")}
+
+        if not is_valid:
             return 409, {"error": self.lang.translate("user.wrong_password")}
 
+        # Reads straight after logging in should not depend on replica lag
+        self._user_id = user.user_id
         return 200, {"token": user.token}
 
     def delete_delete(self, user: User, query_id: str):
@@ -82,15 +173,34 @@ class AccountView(View):
         cast(User, query).delete()
         return 200, {}
 
-    def get_query(self, query_id: str):
-        code, query = get_user(query_id, self.lang)
-        if code != 200:
-            return code, query
-
-        return 200, UserSerializer(self.lang, query).data
+    async def get_query(self, query_id: str):
+        query_user = await User.objects.filter(user_id=query_id).afirst()
+        if query_user is None:
+            return 404, {"error": self.lang.translate("user.not_found", query_id)}
+
+        # Vitals still waiting in the write-behind buffer are newer
+        for name, value in (vitals_buffer.get(query_id) or {}).items():
+            setattr(query_user, name, value)
+        return 200, UserSerializer(self.lang, query_user, **self.fieldset).data
+
+    async def get_all(self, query_id: str):
+        return await get_all(
+            query_id,
+            User.objects.all(),
+            UserSerializer,
+            self.lang,
+            after=self.request.query_params.get("after"),
+            fieldset=self.fieldset,
+        )
 
-    def get_all(self, query_id: str):
-        return get_all(query_id, User.objects.all(), UserSerializer, self.lang)
+    async def get_many(self, query_id: str):
+        return await get_many(
+            query_id,
+            User.objects.all(),
+            UserSerializer,
+            self.lang,
+            fieldset=self.fieldset,
+        )
 
     class Edit(Args):
         user_id: str = ValidString(16)  # type: ignore
@@ -118,27 +228,37 @@ class AccountView(View):
         if post.date_of_birth:
             query_user.date_of_birth = datetime.datetime(*[int(i) for i in reversed(post.date_of_birth.split("/"))])  # type: ignore
         if post.password:
-            query_user.password = str(Password.encrypt(post.password), encoding="utf-8")  # type: ignore
+            try:
+                hashed = password_pool.run(Password.encrypt, post.password)
+            except PoolSaturated:
+                return 429, {"error": self.lang.translate("generic.busy")}
+            query_user.password = str(hashed, encoding="utf-8")  # type: ignore
         if post.role is not None and user.role == 2 and post.role in [0, 1, 2]:
             query_user.role = post.role  # type: ignore
         query_user.save()
 
-        return 200, UserSerializer(self.lang, query_user).data
+        return 200, UserSerializer(self.lang, query_user, **self.fieldset).data
 
     def get_profile(self, query_id: str):
         code, query = get_user(query_id, self.lang)
         if code != 200:
             return code, query
 
-        profile = Profile.secure_get(fk_user=query)
+        profile = ProfileSerializer.plan(Profile.objects).filter(fk_user=query).first()
         if profile is None:
             profile = Profile(fk_user=query)
             profile.save()
 
-        return 200, ProfileSerializer(self.lang, profile).data
+        return 200, ProfileSerializer(self.lang, profile, **self.fieldset).data
 
 
 class FoodView(View):
+    CACHED = ["query", "all", "many"]
+    CACHE_MODELS = [Food, Nutrition]
+    MODEL = Food
+    VERSION_FIELDS = ["updated_at", "fk_nutrition__updated_at"]
+    READ_ONLY = ["search"]
+
     class Create(Args):
         name: str = ValidString(32)  # type: ignore
         description: str = ValidString()  # type: ignore
@@ -157,26 +277,59 @@ class FoodView(View):
 
         food = Food(**post.as_dict(filters=["vitamins", "minerals", "amino_acids"]))
         nutrition = Nutrition(
-            vitamins=json.dumps(post.vitamins),
-            minerals=json.dumps(post.minerals),
-            amino_acids=json.dumps(post.amino_acids),
+            vitamins=post.vitamins,
+            minerals=post.minerals,
+            amino_acids=post.amino_acids,
         )
-        nutrition.save()
-
-        food.fk_nutrition = nutrition  # type: ignore
-        food.save()
-        return 200, FoodSerializer(self.lang, food).data
+        with transaction.atomic():
+            nutrition.save()
+            food.fk_nutrition = nutrition  # type: ignore
+            food.save()
+        return 200, FoodSerializer(self.lang, food, **self.fieldset).data
 
-    def get_query(self, query_id: int):
-        food = Food.secure_get(food_id=query_id)
+    async def get_query(self, query_id: int):
+        food = await FoodSerializer.plan(Food.objects).filter(food_id=query_id).afirst()
 
         if food is None:
             return 404, {"error": self.lang.translate("generic.not_found", query_id)}
 
-        return 200, FoodSerializer(self.lang, food).data
+        return 200, FoodSerializer(self.lang, food, **self.fieldset).data
+
+    async def get_all(self, query_id: str):
+        return await get_all(
+            query_id,
+            Food.objects.all(),
+            FoodSerializer,
+            self.lang,
+            after=self.request.query_params.get("after"),
+            fieldset=self.fieldset,
+        )
+
+    async def get_many(self, query_id: str):
+        return await get_many(
+            query_id,
+            Food.objects.all(),
+            FoodSerializer,
+            self.lang,
+            fieldset=self.fieldset,
+        )
 
-    def get_all(self, query_id: str):
-        return get_all(query_id, Food.objects.all(), FoodSerializer, self.lang)
+    def get_search(self, query_id: str):
+        limit = self.request.query_params.get("limit", "20")
+        if not limit.isnumeric():
+            return 409, {"error": "Invalid format, must be: `?limit=[number]`"}
+
+        results = food_text_index.search(
+            FoodSerializer.plan(Food.objects),
+            query_id,
+            min(max(1, int(limit)), SEARCH_LIMIT),
+        )
+        return 200, {
+            "results": [
+                {**FoodSerializer(self.lang, row, **self.fieldset).data, "rank": rank}
+                for row, rank in results
+            ]
+        }
 
     def delete_delete(self, user: User, query_id: int):
         if user.role == 0:
@@ -192,6 +345,30 @@ class FoodView(View):
 
         return 200, {}
 
+    class Search(Args):
+        minimum: str = ValidJson({i: ValidFloat() for i in NUTRIENTS}, is_optional=True)  # type: ignore
+        maximum: str = ValidJson({i: ValidFloat() for i in NUTRIENTS}, is_optional=True)  # type: ignore
+        target: str = ValidJson({i: ValidFloat() for i in NUTRIENTS}, is_optional=True)  # type: ignore
+        limit: str = ValidInteger(is_optional=True)  # type: ignore
+
+    def post_search(self, post: Search):
+        results = search_foods(
+            FoodSerializer.plan(Food.objects),
+            post.minimum or {},  # type: ignore
+            post.maximum or {},  # type: ignore
+            post.target or {},  # type: ignore
+            min(max(1, post.limit or 20), SEARCH_LIMIT),  # type: ignore
+        )
+        return 200, {
+            "results": [
+                {
+                    **FoodSerializer(self.lang, food, **self.fieldset).data,
+                    "distance": distance,
+                }
+                for food, distance in results
+            ]
+        }
+
     class Edit(Args):
         food_id: str = ValidInteger()  # type: ignore
         name: str = ValidString(32, is_optional=True)  # type: ignore
@@ -230,15 +407,18 @@ class FoodView(View):
         if post.calories:
             food.calories = post.calories  # type: ignore
         if post.vitamins:
-            food.fk_nutrition.vitamins = json.dumps(post.vitamins)  # type: ignore
+            food.fk_nutrition.vitamins = post.vitamins  # type: ignore
         if post.minerals:
-            food.fk_nutrition.minerals = json.dumps(post.minerals)  # type: ignore
+            food.fk_nutrition.minerals = post.minerals  # type: ignore
         if post.amino_acids:
-            food.fk_nutrition.amino_acids = json.dumps(post.amino_acids)  # type: ignore
+            food.fk_nutrition.amino_acids = post.amino_acids  # type: ignore
 
-        food.save()
+        with transaction.atomic():
+            if post.vitamins or post.minerals or post.amino_acids:
+                food.fk_nutrition.save()  # type: ignore
+            food.save()
 
-        return 200, FoodSerializer(self.lang, food).data
+        return 200, FoodSerializer(self.lang, food, **self.fieldset).data
 
 
 class SubmissionView(View):
@@ -249,19 +429,39 @@ class SubmissionView(View):
         submission = Submission(note=post.note, fk_user=user)
         submission.save()
 
-        return 200, SubmissionSerializer(self.lang, submission).data
+        return 200, SubmissionSerializer(self.lang, submission, **self.fieldset).data
 
-    def get_query(self, query_id: str):
-        submission = Submission.secure_get(submission_id=query_id)
+    async def get_query(self, query_id: str):
+        submission = (
+            await SubmissionSerializer.plan(Submission.objects)
+            .filter(submission_id=query_id)
+            .afirst()
+        )
 
         if submission is None:
             return 404, {"error": self.lang.translate("generic.not_found", query_id)}
 
-        return 200, SubmissionSerializer(self.lang, submission).data
+        await SubmissionSerializer.aprefetch([submission], **self.fieldset)
+
+        return 200, SubmissionSerializer(self.lang, submission, **self.fieldset).data
+
+    async def get_all(self, query_id: str):
+        return await get_all(
+            query_id,
+            Submission.objects.all(),
+            SubmissionSerializer,
+            self.lang,
+            after=self.request.query_params.get("after"),
+            fieldset=self.fieldset,
+        )
 
-    def get_all(self, query_id: str):
-        return get_all(
-            query_id, Submission.objects.all(), SubmissionSerializer, self.lang
+    async def get_many(self, query_id: str):
+        return await get_many(
+            query_id,
+            Submission.objects.all(),
+            SubmissionSerializer,
+            self.lang,
+            fieldset=self.fieldset,
         )
 
     def delete_delete(self, user: User, query_id: str):
@@ -301,10 +501,15 @@ class SubmissionView(View):
             submission.is_accepted = post.is_accepted  # type: ignore
         submission.save()
 
-        return 200, SubmissionSerializer(self.lang, submission).data
+        return 200, SubmissionSerializer(self.lang, submission, **self.fieldset).data
 
 
 class DietView(View):
+    CACHED = ["query", "all", "many"]
+    CACHE_MODELS = [Diet, DietIntake]
+    MODEL = Diet
+    VERSION_FIELDS = ["updated_at", "intake__updated_at"]
+
     class Create(Args):
         name: str = ValidString(32)  # type: ignore
         description: str = ValidString(is_optional=True)  # type: ignore
@@ -317,18 +522,53 @@ class DietView(View):
         diet = Diet(**post.as_dict())
         diet.save()
 
-        return 200, DietSerializer(self.lang, diet).data
+        return 200, DietSerializer(self.lang, diet, **self.fieldset).data
 
-    def get_query(self, query_id: str):
-        diet = Diet.secure_get(diet_id=query_id)
+    async def get_query(self, query_id: str):
+        diet = await DietSerializer.plan(Diet.objects).filter(diet_id=query_id).afirst()
 
         if diet is None:
             return 404, {"error": self.lang.translate("generic.not_found", query_id)}
 
-        return 200, DietSerializer(self.lang, diet).data
+        await DietSerializer.aprefetch([diet], **self.fieldset)
 
-    def get_all(self, query_id: str):
-        return get_all(query_id, Diet.objects.all(), DietSerializer, self.lang)
+        return 200, DietSerializer(self.lang, diet, **self.fieldset).data
+
+    async def get_all(self, query_id: str):
+        return await get_all(
+            query_id,
+            Diet.objects.all(),
+            DietSerializer,
+            self.lang,
+            after=self.request.query_params.get("after"),
+            fieldset=self.fieldset,
+        )
+
+    async def get_many(self, query_id: str):
+        return await get_many(
+            query_id,
+            Diet.objects.all(),
+            DietSerializer,
+            self.lang,
+            fieldset=self.fieldset,
+        )
+
+    def get_search(self, query_id: str):
+        limit = self.request.query_params.get("limit", "20")
+        if not limit.isnumeric():
+            return 409, {"error": "Invalid format, must be: `?limit=[number]`"}
+
+        results = diet_text_index.search(
+            DietSerializer.plan(Diet.objects),
+            query_id,
+            min(max(1, int(limit)), SEARCH_LIMIT),
+        )
+        return 200, {
+            "results": [
+                {**DietSerializer(self.lang, row, **self.fieldset).data, "rank": rank}
+                for row, rank in results
+            ]
+        }
 
     class Edit(Args):
         diet_id: str = ValidInteger()  # type: ignore
@@ -356,7 +596,7 @@ class DietView(View):
 
         diet.save()
 
-        return 200, DietSerializer(self.lang, diet).data
+        return 200, DietSerializer(self.lang, diet, **self.fieldset).data
 
     def delete_delete(self, user: User, query_id: str):
         if user.role == 0:  # type: ignore
@@ -373,39 +613,63 @@ class DietView(View):
 
 
 class MealPlanView(View):
+    CACHED = ["query", "all", "many"]
+    CACHE_MODELS = [MealPlan, Diet, DietIntake]
+    MODEL = MealPlan
+    VERSION_FIELDS = [
+        "updated_at",
+        "fk_diet__updated_at",
+        "fk_diet__intake__updated_at",
+    ]
+
     class Create(Args):
         time: str = ValidMealTime()  # type: ignore
-        diet_id: str = ValidInteger()  # type: ignore
-        foods: str = ValidList()  # type: ignore
+        diet_id: Diet = ValidId(Diet, "diet_id", int)  # type: ignore
+        foods: list[Food] = ValidList(Food)  # type: ignore
 
     def post_create(self, post: Create, user: User):
         if user.role == 0:  # type: ignore
             return 403, {"error": self.lang.translate("user.no_permission")}
 
-        diet = Diet.secure_get(diet_id=post.diet_id)
+        with transaction.atomic():
+            meal_plan = MealPlan(time=post.time, fk_diet=post.diet_id)
+            meal_plan.save()
+            meal_plan.set_foods([i.pk for i in post.foods])
 
-        if diet is None:
-            return 404, {
-                "error": self.lang.translate("generic.not_found", post.diet_id)
-            }
+        return 200, MealPlanSerializer(self.lang, meal_plan, **self.fieldset).data
 
-        meal_plan = MealPlan(
-            time=post.time, fk_diet=diet, foods=",".join([str(i) for i in post.foods])
+    async def get_query(self, query_id: str):
+        meal_plan = (
+            await MealPlanSerializer.plan(MealPlan.objects)
+            .filter(meal_plan_id=query_id)
+            .afirst()
         )
-        meal_plan.save()
-
-        return 200, MealPlanSerializer(self.lang, meal_plan).data
-
-    def get_query(self, query_id: str):
-        meal_plan = MealPlan.secure_get(meal_plan_id=query_id)
 
         if meal_plan is None:
             return 404, {"error": self.lang.translate("generic.not_found", query_id)}
 
-        return 200, MealPlanSerializer(self.lang, meal_plan).data
+        await MealPlanSerializer.aprefetch([meal_plan], **self.fieldset)
+
+        return 200, MealPlanSerializer(self.lang, meal_plan, **self.fieldset).data
+
+    async def get_all(self, query_id: str):
+        return await get_all(
+            query_id,
+            MealPlan.objects.all(),
+            MealPlanSerializer,
+            self.lang,
+            after=self.request.query_params.get("after"),
+            fieldset=self.fieldset,
+        )
 
-    def get_all(self, query_id: str):
-        return get_all(query_id, MealPlan.objects.all(), MealPlanSerializer, self.lang)
+    async def get_many(self, query_id: str):
+        return await get_many(
+            query_id,
+            MealPlan.objects.all(),
+            MealPlanSerializer,
+            self.lang,
+            fieldset=self.fieldset,
+        )
 
     def delete_delete(self, query_id: str):
         meal_plan = MealPlan.secure_get(meal_plan_id=query_id)
@@ -419,70 +683,55 @@ class MealPlanView(View):
 
 
 class SystemView(View):
+    def get_metrics(self, user: User):
+        if user.role != 2:
+            return 403, {"error": self.lang.translate("user.no_permission")}
+
+        return 200, {
+            "user_cache": user_cache.stats,
+            "password_pool": password_pool.stats,
+            "response_cache": response_cache.stats,
+            "vitals_buffer": vitals_buffer.stats,
+        }
+
     def get_backup(self, user: User, query_id: str):
         if user.role != 2:
             return 403, {"error": self.lang.translate("user.no_permission")}
 
-        match query_id:
-            case "users":
-                return 201, UserResource().export(format="csv").csv  # type: ignore
-            case "profiles":
-                return 201, ProfileResource().export(format="csv").csv  # type: ignore
-            case "diets":
-                return 201, DietResource().export(format="csv").csv  # type: ignore
-            case "meal_plans":
-                return 201, MealPlanResource().export(format="csv").csv  # type: ignore
-            case "submissions":
-                return 201, SubmissionResource().export(format="csv").csv  # type: ignore
-            case "foods":
-                return 201, FoodResource().export(format="csv").csv  # type: ignore
-            case "nutritions":
-                return 201, NutritionResource().export(format="csv").csv  # type: ignore
-            case _:
-                return 201, ""
+        resource = BACKUP_RESOURCES.get(query_id)
+        if resource is None:
+            return 201, ""
+
+        accept = self.request.headers.get("Accept-Encoding", "")
+        resource = resource()
+        return 201, stream_csv(
+            resource,
+            query_id,
+            compress="gzip" in accept,
+            is_async=isinstance(self.request._request, ASGIRequest),
+            using=router.db_for_read(resource._meta.model),
+        )
 
     class Rollback(Args):
         resource: str = ValidString()  # type: ignore
         data: str = ValidString()  # type: ignore
+        batch_size: int = ValidInteger(is_optional=True)  # type: ignore
+        dry_run: bool = ValidBoolean(is_optional=True)  # type: ignore
 
     def post_rollback(self, post: Rollback, user: User):
         if user.role != 2:
             return 403, {"error": self.lang.translate("user.no_permission")}
 
-        data = tablib.Dataset()
-        data.csv = post.data  # type: ignore
+        resource = BACKUP_RESOURCES.get(post.resource)
+        if resource is None:
+            return 201, ""
 
-        match post.resource:
-            case "users":
-                return 200, {
-                    "has_errors": UserResource().import_data(data).has_errors()  # type: ignore
-                }
-            case "profiles":
-                return 200, {
-                    "has_errors": ProfileResource().import_data(data).has_errors()  # type: ignore
-                }
-            case "diets":
-                return 200, {
-                    "has_errors": DietResource().import_data(data).has_errors()  # type: ignore
-                }
-            case "meal_plans":
-                return 200, {
-                    "has_errors": MealPlanResource().import_data(data).has_errors()  # type: ignore
-                }
-            case "submissions":
-                return 200, {
-                    "has_errors": SubmissionResource().import_data(data).has_errors()  # type: ignore
-                }
-            case "foods":
-                return 200, {
-                    "has_errors": FoodResource().import_data(data).has_errors()  # type: ignore
-                }
-            case "nutritions":
-                return 200, {
-                    "has_errors": NutritionResource().import_data(data).has_errors()  # type: ignore
-                }
-            case _:
-                return 201, ""
+        return 200, restore_csv(
+            resource(),
+            post.data,
+            batch_size=max(1, post.batch_size or RESTORE_BATCH_SIZE),
+            dry_run=bool(post.dry_run),
+        )
 
 
 class IotView(View):
@@ -492,14 +741,85 @@ class IotView(View):
         heart_rate: int = ValidInteger()  # type: ignore
         oxygen_level: int = ValidInteger()  # type: ignore
 
-    def post_update(self, post: Update):
-        query_user: User = User.secure_get(user_id=post.user_id)
+    async def post_update(self, post: Update):
+        query_user = await User.objects.filter(user_id=post.user_id).afirst()
         if query_user is None:
             return 404, {"error": self.lang.translate("user.not_found", post.user_id)}
 
         query_user.heart_rate = post.heart_rate  # type: ignore
         query_user.oxygen_level = post.oxygen_level  # type: ignore
         query_user.blood_pressure = post.blood_pressure  # type: ignore
-        query_user.save()
+        await vitals_buffer.asubmit(
+            [
+                {
+                    "user_id": query_user.user_id,
+                    **{i: getattr(post, i) for i in VITALS},
+                    "timestamp": None,
+                }
+            ]
+        )
+
+        return 200, UserSerializer(self.lang, query_user, **self.fieldset).data
+
+    class Batch(Args):
+        readings: list = ValidRecords(
+            {
+                "user_id": ValidString(16),
+                "blood_pressure": ValidInteger(),
+                "heart_rate": ValidInteger(),
+                "oxygen_level": ValidInteger(),
+                "timestamp": ValidTimestamp(is_optional=True),
+            },
+            max_length=IOT_BATCH_SIZE,
+        )  # type: ignore
+
+    async def post_batch(self, post: Batch):
+        return 200, await record_readings(post.readings)
+
+    async def get_vitals(self, user: User, query_id: str):
+        if user.user_id != query_id and user.role == 0:
+            return 403, {"error": self.lang.translate("user.no_permission")}
 
-        return 200, UserSerializer(self.lang, query_user).data
+        params = self.request.query_params
+        resolution = params.get("resolution", "raw")
+        error = {
+            "error": "Invalid format, must be: "
+            "`?from=[unix]&to=[unix]&resolution=[raw|minute|hour]`",
+        }
+        if resolution != "raw" and resolution not in ROLLUP_RESOLUTIONS:
+            return 409, error
+        end = TIMESTAMP.parse(params.get("to") or timezone.now().timestamp())
+        if end is INVALID:
+            return 409, error
+        start = TIMESTAMP.parse(params.get("from") or max(end - 86400, 0))
+        if start is INVALID:
+            return 409, error
+        start, end = [
+            datetime.datetime.fromtimestamp(i, tz=datetime.timezone.utc)
+            for i in [start, end]
+        ]
+
+        if resolution == "raw":
+            return 200, {
+                "resolution": resolution,
+                "results": [
+                    i
+                    async for i in VitalsReading.objects.filter(
+                        fk_user_id=query_id, timestamp__range=(start, end)
+                    )
+                    .order_by("timestamp")
+                    .values("timestamp", *VITALS)[:VITALS_POINT_LIMIT]
+                ],
+            }
+
+        return 200, {
+            "resolution": resolution,
+            "results": [
+                i.as_dict()
+                async for i in VitalsRollup.objects.filter(
+                    fk_user_id=query_id,
+                    resolution=ROLLUP_RESOLUTIONS[resolution],
+                    bucket__range=(start, end),
+                ).order_by("bucket")[:VITALS_POINT_LIMIT]
+            ],
+        }
@@ -0,0 +1,373 @@
+import atexit
+import datetime
+import glob
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import OperationalError, connections, transaction
+from django.utils import timezone
+
+from .models import VITALS, User, VitalsReading
+from .utils.validators import TIMESTAMP
+
+try:
+    import fcntl
+except ImportError:  # Windows, journals are named by process id there
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+def get_timestamp(reading: dict):
+    return datetime.datetime.fromtimestamp(
+        reading["timestamp"], tz=datetime.timezone.utc
+    )
+
+
+def is_valid_reading(reading) -> bool:
+    return (
+        type(reading) is dict
+        and type(reading.get("user_id")) is str
+        and all(type(reading.get(i)) is int for i in VITALS)
+        and TIMESTAMP.validate(reading.get("timestamp"))
+    )
+
+
+def store_readings(readings: list[dict]):
+    # Readings are dicts of user_id, VITALS and a unix timestamp, the newest
+    # one per user is written to its User row
+    latest: dict[str, dict] = {}
+    for reading in sorted(readings, key=lambda i: i["timestamp"]):
+        latest[reading["user_id"]] = reading
+
+    now = timezone.now()
+    with transaction.atomic():
+        known = set(
+            User.objects.filter(user_id__in=latest.keys()).values_list(
+                "user_id", flat=True
+            )
+        )
+        User.objects.bulk_update(
+            [
+                User(
+                    user_id=user_id,
+                    **{i: reading[i] for i in VITALS},
+                    updated_at=now,
+                )
+                for user_id, reading in latest.items()
+                if user_id in known
+            ],
+            [*VITALS, "updated_at"],
+            batch_size=500,
+        )
+        VitalsReading.record(
+            [
+                VitalsReading(
+                    fk_user_id=reading["user_id"],
+                    timestamp=get_timestamp(reading),
+                    **{i: reading[i] for i in VITALS},
+                )
+                for reading in readings
+                if reading["user_id"] in known
+            ]
+        )
+
+
+class VitalsBuffer:
+    # Write-behind buffer: readings are journaled, then stored in one
+    # transaction every interval seconds or once max_size are pending.
+    # Every process journals to its own <journal>.<slot> file, rotated to
+    # <slot>.flushing while a flush runs. A slot is held by a file lock that
+    # dies with its process, so a restarted process replays both files of the
+    # slot it takes and adopts slots nobody holds. Readings that cannot be
+    # stored are appended to <journal>.rejected.
+    def __init__(
+        self,
+        enabled: bool = False,
+        interval: float = 1.0,
+        max_size: int = 1000,
+        journal: str | os.PathLike | None = None,
+        fsync: bool = True,
+    ):
+        self.enabled = enabled
+        self.interval = interval
+        self.max_size = max_size
+        self.base = os.fspath(journal) if journal else None
+        self.journal: str | None = None
+        self.fsync = fsync
+        self.pending: list[dict] = []
+        self.latest: dict[str, dict] = {}
+        self._file = None
+        self._slot = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: threading.Thread | None = None
+        self.count = 0
+        self.failed = 0
+        self.rejected = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.last_time = 0.0
+
+    @property
+    def flushing(self):
+        return f"{self.journal}.flushing"
+
+    def start(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            if self.base:
+                self.journal = self.journal or self._claim()
+                self._replay()
+            # Only marked as started once replay went through, a failed
+            # replay is retried by the next submit
+            thread = threading.Thread(
+                target=self._run, name="vitals-buffer", daemon=True
+            )
+            thread.start()
+            atexit.register(self.flush)
+            self._thread = thread
+
+    @staticmethod
+    def _lock_slot(path: str):
+        file = open(f"{path}.lock", "a")
+        try:
+            fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)  # type: ignore
+        except BlockingIOError:
+            file.close()
+            return None
+        return file
+
+    def _claim(self) -> str:
+        if fcntl is None:
+            return f"{self.base}.{os.getpid()}"
+        for slot in itertools.count():
+            path = f"{self.base}.{slot}"
+            self._slot = self._lock_slot(path)
+            if self._slot is not None:
+                return path
+
+    def _load(self, path: str) -> list[dict]:
+        readings = self._accept(self._read(f"{path}.flushing"))
+        if readings:
+            # The last flush may have committed before its journal was removed
+            stored = set(
+                VitalsReading.objects.filter(
+                    fk_user_id__in={i["user_id"] for i in readings},
+                    timestamp__in={get_timestamp(i) for i in readings},
+                ).values_list("fk_user_id", "timestamp")
+            )
+            readings = [
+                i for i in readings if (i["user_id"], get_timestamp(i)) not in stored
+            ]
+        return readings + self._accept(self._read(path))
+
+    def _replay(self):
+        readings = self._load(self.journal)  # type: ignore
+
+        # Slots whose lock can be taken belonged to processes that are gone,
+        # their readings move into this process's journal
+        for lock in glob.glob(f"{glob.escape(self.base)}.*.lock"):  # type: ignore
+            path = lock[: -len(".lock")]
+            if fcntl is None or path == self.journal:
+                continue
+            slot = self._lock_slot(path)
+            if slot is None:
+                continue
+            try:
+                adopted = self._load(path)
+                if adopted:
+                    with self._lock:
+                        self._write(adopted)
+                    readings += adopted
+                for i in [path, f"{path}.flushing"]:
+                    if os.path.exists(i):
+                        os.remove(i)
+            finally:
+                slot.close()
+
+        with self._lock:
+            self._add(readings)
+
+    @staticmethod
+    def _read(path: str) -> list[dict]:
+        if not os.path.exists(path):
+            return []
+        readings = []
+        with open(path) as file:
+            for line in file:
+                try:
+                    readings.extend(json.loads(line))
+                except ValueError:
+                    # Torn write from a crash, nothing after it was acknowledged
+                    break
+        return readings
+
+    def _write(self, readings: list[dict]):
+        if self._file is None:
+            self._file = open(self.journal, "a")  # type: ignore
+        self._file.write(json.dumps(readings) + "\n")
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+    def _quarantine(self, readings: list[dict]):
+        if not readings:
+            return
+        self.rejected += len(readings)
+        logger.error("Rejected %d vitals readings", len(readings))
+        if self.base:
+            with open(f"{self.base}.rejected", "a") as file:
+                file.write(json.dumps(readings) + "\n")
+
+    def _accept(self, readings: list[dict]) -> list[dict]:
+        self._quarantine([i for i in readings if not is_valid_reading(i)])
+        return [i for i in readings if is_valid_reading(i)]
+
+    def _add(self, readings: list[dict]):
+        self.pending.extend(readings)
+        for reading in readings:
+            current = self.latest.get(reading["user_id"])
+            if current is None or current["timestamp"] <= reading["timestamp"]:
+                self.latest[reading["user_id"]] = reading
+
+    def submit(self, readings: list[dict]):
+        now = time.time()
+        readings = self._accept(
+            [
+                {
+                    **i,
+                    "timestamp": now if i.get("timestamp") is None else i["timestamp"],
+                }
+                for i in readings
+            ]
+        )
+        if not readings:
+            return
+        if not self.enabled:
+            return store_readings(readings)
+
+        self.start()
+        with self._lock:
+            if self.journal:
+                self._write(readings)
+            self._add(readings)
+            size = len(self.pending)
+        if size >= self.max_size:
+            self._wake.set()
+
+    async def asubmit(self, readings: list[dict]):
+        await sync_to_async(self.submit)(readings)
+
+    def get(self, user_id: str) -> dict | None:
+        reading = self.latest.get(user_id)
+        return None if reading is None else {i: reading[i] for i in VITALS}
+
+    def _rotate(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if not os.path.exists(self.journal):  # type: ignore
+            return
+        if not os.path.exists(self.flushing):
+            os.replace(self.journal, self.flushing)  # type: ignore
+            return
+        # A failed flush left its readings behind, they are retried together
+        with open(self.flushing, "a") as target, open(self.journal) as source:  # type: ignore
+            target.write(source.read())
+        os.remove(self.journal)  # type: ignore
+
+    def _store(self, readings: list[dict]):
+        try:
+            store_readings(readings)
+        except OperationalError:
+            # Locked or unreachable database, the whole batch is retried
+            raise
+        except Exception:
+            logger.exception("Storing %d vitals readings failed", len(readings))
+            # Store the rest and set aside whatever still fails on its own
+            rejected = []
+            for reading in readings:
+                try:
+                    store_readings([reading])
+                except Exception:
+                    rejected.append(reading)
+            self._quarantine(rejected)
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                readings, self.pending = self.pending, []
+                if self.journal:
+                    self._rotate()
+            if not readings:
+                return
+
+            start = time.perf_counter()
+            try:
+                self._store(readings)
+            except Exception:
+                with self._lock:
+                    self.pending = readings + self.pending
+                    self.failed += 1
+                raise
+            elapsed = time.perf_counter() - start
+
+            with self._lock:
+                if self.journal and os.path.exists(self.flushing):
+                    os.remove(self.flushing)
+                for reading in readings:
+                    if self.latest.get(reading["user_id"]) is reading:
+                        del self.latest[reading["user_id"]]
+                self.count += 1
+                self.total_time += elapsed
+                self.max_time = max(self.max_time, elapsed)
+                self.last_time = elapsed
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Vitals flush failed, retrying next interval")
+            finally:
+                # Nothing ends requests on this thread to recycle connections
+                connections.close_all()
+
+    @property
+    def stats(self):
+        journal = sum(
+            os.path.getsize(i)
+            for i in [self.journal, self.flushing]
+            if self.journal and os.path.exists(i)
+        )
+        return {
+            "enabled": self.enabled,
+            "backlog": len(self.pending),
+            "users": len(self.latest),
+            "count": self.count,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "average_ms": self.total_time / self.count * 1000 if self.count else 0.0,
+            "max_ms": self.max_time * 1000,
+            "last_ms": self.last_time * 1000,
+            "journal_bytes": journal,
+        }
+
+
+vitals_buffer = VitalsBuffer(
+    **{k.lower(): v for k, v in getattr(settings, "VITALS_BUFFER", {}).items()}
+)
@@ -12,5 +12,19 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "server.settings")
+# Async views run their queries on whichever thread sync_to_async picks and
+# Django only closes old connections around requests, so persistent
+# connections would pile up under ASGI
+os.environ.setdefault("SQLITE_CONN_MAX_AGE", "0")
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Needs the app registry, which get_asgi_application() sets up
+from api.stream import telemetry_stream  # noqa: E402
+
+
+async def application(scope, receive, send):
+    # Django only speaks HTTP, device WebSockets are handled by api.stream
+    if scope["type"] == "websocket":
+        return await telemetry_stream(scope, receive, send)
+    return await django_application(scope, receive, send)
@@ -0,0 +1,67 @@
+import os
+
+from django.core.exceptions import ImproperlyConfigured
+
+# Pragma values are formatted into SQL, so only these are accepted
+PRAGMA_VALUES = {
+    "journal_mode": {"DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF"},
+    "synchronous": {"OFF", "NORMAL", "FULL", "EXTRA"},
+    "temp_store": {"DEFAULT", "FILE", "MEMORY"},
+    "mmap_size": int,
+    "cache_size": int,
+}
+
+
+def get_env(name: str, default, cast=str):
+    value = os.environ.get(name)
+    return default if value in [None, ""] else cast(value)
+
+
+def sqlite_database(name) -> dict:
+    # PRAGMAS is not a Django key, api.signals applies it to every new
+    # connection. The busy timeout is sqlite3's own connect() timeout.
+    database = {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": name,
+        "CONN_MAX_AGE": get_env("SQLITE_CONN_MAX_AGE", 600, int),
+        "CONN_HEALTH_CHECKS": True,
+        "OPTIONS": {
+            "timeout": get_env("SQLITE_BUSY_TIMEOUT", 5.0, float),
+        },
+        "PRAGMAS": {
+            "journal_mode": get_env("SQLITE_JOURNAL_MODE", "WAL"),
+            "synchronous": get_env("SQLITE_SYNCHRONOUS", "NORMAL"),
+            "mmap_size": get_env("SQLITE_MMAP_SIZE", 256 * 1024 * 1024, int),
+            # Negative sizes are KiB, so this is 64 MiB per connection
+            "cache_size": get_env("SQLITE_CACHE_SIZE", -64 * 1024, int),
+            "temp_store": "MEMORY",
+        },
+    }
+    check_pragmas(database["PRAGMAS"])
+    return database
+
+
+def sqlite_replicas() -> dict:
+    # Comma separated SQLite files kept in sync with the default database
+    paths = [i for i in get_env("SQLITE_REPLICAS", "").split(",") if i]
+    return {
+        f"replica_{i}": {**sqlite_database(path), "TEST": {"MIRROR": "default"}}
+        for i, path in enumerate(paths)
+    }
+
+
+def check_pragmas(pragmas: dict):
+    for name, value in pragmas.items():
+        allowed = PRAGMA_VALUES.get(name)
+        if allowed is int:
+            valid = type(value) is int
+        else:
+            valid = allowed is not None and str(value).upper() in allowed
+        if not valid:
+            raise ImproperlyConfigured(f"Invalid SQLite pragma: {name}={value!r}")
+
+
+def apply_pragmas(connection, pragmas: dict):
+    check_pragmas(pragmas)
+    for name, value in pragmas.items():
+        connection.execute(f"PRAGMA {name}={value}")
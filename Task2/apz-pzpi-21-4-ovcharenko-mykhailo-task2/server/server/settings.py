@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/5.0/ref/settings/
 
 from pathlib import Path
 
+from .database import get_env, sqlite_database, sqlite_replicas
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -102,15 +104,114 @@ CORS_ALLOW_METHODS = ("GET", "DELETE", "POST", "OPTIONS")
 
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
+# SQLite is tuned from the environment: SQLITE_PATH, SQLITE_JOURNAL_MODE,
+# SQLITE_SYNCHRONOUS, SQLITE_MMAP_SIZE, SQLITE_CACHE_SIZE,
+# SQLITE_BUSY_TIMEOUT (seconds) and SQLITE_CONN_MAX_AGE (seconds, 0 by
+# default under ASGI, see asgi.py).
+# SQLITE_REPLICAS adds comma separated read replicas.
 
 DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
-    }
+    "default": sqlite_database(get_env("SQLITE_PATH", BASE_DIR / "db.sqlite3")),
+    **sqlite_replicas(),
+    # Only opened by tests, which create and migrate it like default to stand
+    # in for a replica that lags behind
+    "test_replica": {
+        **sqlite_database(BASE_DIR / "test_replica.sqlite3"),
+        "TEST": {"NAME": None},
+    },
+}
+
+DATABASE_ROUTERS = ["api.utils.routing.ReplicaRouter"]
+
+
+# Read replicas
+# View GET handlers read from ALIASES, everything else uses default. Nothing
+# copies writes into the replica files by itself: run
+# `python manage.py sync_replicas --interval 5` next to the server (or ship
+# the database with external replication such as Litestream).
+# A user reads from default for TTL seconds after registering, logging in or
+# writing. BACKEND is a CACHES alias as in USER_CACHE below, it has to be
+# shared between workers (Redis, Memcached) when running more than one
+# process, Django's default LocMemCache only covers the current one.
+# Handlers whose responses go to RESPONSE_CACHE always read default, their
+# cache misses are the only GETs replicas don't serve.
+
+READ_REPLICAS = {
+    "ALIASES": [i for i in DATABASES if i.startswith("replica_")],
+    "BACKEND": "default",
+    "MAX_SIZE": 4096,
+    "TTL": get_env("SQLITE_REPLICA_STICKY", 5.0, float),
+}
+
+
+# Authenticated user cache
+# BACKEND is either "local" (per-process LRU) or an alias from CACHES shared
+# between workers. Invalidations only reach the process that made the change,
+# so "local" is for single-process deployments, with more workers a user
+# edited or deleted elsewhere stays authenticated for up to TTL seconds.
+# Async views read these caches on the event loop, so the CACHES backend must
+# not go through the ORM: DatabaseCache is refused.
+
+USER_CACHE = {
+    "BACKEND": "local",
+    "MAX_SIZE": 1024,
+    "TTL": 60,
+}
+
+
+# Response cache for public GET handlers, same BACKEND options as above
+
+RESPONSE_CACHE = {
+    "BACKEND": "local",
+    "MAX_SIZE": 4096,
+    "TTL": 300,
+}
+
+
+# Device telemetry WebSocket (ws://.../api/<lang>/iot/stream)
+# Readings are stored and acknowledged every ACK_SIZE readings or
+# ACK_INTERVAL seconds, whichever comes first.
+
+IOT_STREAM = {
+    "ACK_SIZE": 32,
+    "ACK_INTERVAL": 1.0,
+}
+
+
+# Write-behind buffer for IoT vitals
+# Readings are appended to JOURNAL (fsynced when FSYNC) and written to the
+# database in one transaction every INTERVAL seconds or MAX_SIZE readings.
+
+VITALS_BUFFER = {
+    "ENABLED": True,
+    "INTERVAL": 1.0,
+    "MAX_SIZE": 1000,
+    "JOURNAL": BASE_DIR / "vitals.journal",
+    "FSYNC": True,
 }
 
 
+# bcrypt worker pool
+# KIND is "thread" or "process"; requests beyond WORKERS + MAX_QUEUE are
+# rejected with 429.
+
+PASSWORD_POOL = {
+    "KIND": "thread",
+    "WORKERS": 4,
+    "MAX_QUEUE": 32,
+}
+
+
+# Largest number of ids accepted by the <view>/many batch-fetch routes
+
+BATCH_FETCH_LIMIT = 100
+
+
+# Largest page served by the <view>/all routes, bigger sizes are clamped to it
+
+PAGE_SIZE_LIMIT = 1024
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 